@@ -1,5 +1,57 @@
 <?php
 
-    echo shell_exec("python3 /var/www/html/doorsos/read.py")
+    // Rejected here so bad requests never reach read.py or get an ETag the game would cache
+    $valid = true;
+    foreach (['difficulty', 'since', 'limit', 'offset'] as $name) {
+        if (isset($_GET[$name]) && !is_string($_GET[$name])) {
+            $valid = false;
+        }
+    }
+    if ($valid && isset($_GET['since'])) {
+        $valid = preg_match('/^(\d{1,2})-(\d{1,2})-(\d{4})$/', $_GET['since'], $parts) === 1
+            && checkdate((int)$parts[2], (int)$parts[1], (int)$parts[3]);
+    }
+    foreach (['limit', 'offset'] as $name) {
+        if ($valid && isset($_GET[$name]) && !ctype_digit($_GET[$name])) {
+            $valid = false;
+        }
+    }
+    if (!$valid) {
+        http_response_code(400);
+        exit;
+    }
+
+    $record = '/var/www/html/doorsos/record.json';
+    $last_modified = filemtime($record);
+    // Each filter gives different records, so the query is part of the ETag
+    $etag = '"' . md5(md5_file($record) . $_SERVER['QUERY_STRING']) . '"';
+
+    // Let the game keep its cached copy if the records haven't changed
+    if (isset($_SERVER['HTTP_IF_NONE_MATCH'])) {
+        $not_modified = $_SERVER['HTTP_IF_NONE_MATCH'] === $etag;
+    } else {
+        $not_modified = isset($_SERVER['HTTP_IF_MODIFIED_SINCE']) && strtotime($_SERVER['HTTP_IF_MODIFIED_SINCE']) >= $last_modified;
+    }
+    if ($not_modified) {
+        http_response_code(304);
+        exit;
+    }
+
+    $args = '';
+    foreach (['difficulty', 'since', 'limit', 'offset'] as $name) {
+        if (isset($_GET[$name])) {
+            $args .= ' --' . $name . ' ' . escapeshellarg($_GET[$name]);
+        }
+    }
+    exec("python3 /var/www/html/doorsos/read.py" . $args, $output, $status);
+    if ($status !== 0) {
+        // argparse exits with 2 when it doesn't like the arguments
+        http_response_code($status === 2 ? 400 : 500);
+        exit;
+    }
+    header('ETag: ' . $etag);
+    header('Last-Modified: ' . gmdate('D, d M Y H:i:s', $last_modified) . ' GMT');
+    header('Content-Type: application/json');
+    echo implode("\n", $output);
 
 ?>
\ No newline at end of file
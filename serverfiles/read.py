@@ -1,9 +1,56 @@
 import json
 import os
+import argparse
+from datetime import date
 
 os.chdir(os.path.dirname(__file__))
 
+
+def parse_date(text):
+    day, month, year = text.split('-')
+    return date(int(year), int(month), int(day))
+
+
+def date_argument(text):
+    try:
+        return parse_date(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{text!r} is not a DD-MM-YYYY date')
+
+
+def count_argument(text):
+    try:
+        value = int(text)
+    except ValueError:
+        value = -1
+    if value < 0:
+        raise argparse.ArgumentTypeError(f'{text!r} is not a whole number')
+    return value
+
+
+# Bad arguments make argparse exit with code 2, which read.php turns into a 400
+parser = argparse.ArgumentParser(
+    description='Prints leaderboard records as json, highest score first')
+parser.add_argument('--difficulty', default='All')
+parser.add_argument('--since', type=date_argument, default=None,
+                    help='Only records from this DD-MM-YYYY date onwards')
+parser.add_argument('--limit', type=count_argument, default=None)
+parser.add_argument('--offset', type=count_argument, default=0)
+args = parser.parse_args()
+
+
 with open('record.json', 'r', encoding='utf-8') as f:
-    text = f.read()
+    records = json.load(f)
+
+if args.difficulty != 'All':
+    records = [record for record in records
+               if record['difficulty'] == args.difficulty]
+if args.since is not None:
+    records = [record for record in records
+               if parse_date(record['date']) >= args.since]
+
+records.sort(key=lambda x: x['score'], reverse=True)
+start = args.offset
+end = None if args.limit is None else start+args.limit
 
-print(text)
\ No newline at end of file
+print(json.dumps(records[start:end]))
\ No newline at end of file
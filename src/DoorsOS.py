@@ -4,10 +4,12 @@ import requests
 from utils import *
 from constants import *
 import minigames
-import time
+from profiler import FrameProfiler
 import pygame
 import random
 import os
+import getpass
+from concurrent.futures import Future, ThreadPoolExecutor
 
 
 class InfoBar:
@@ -15,9 +17,7 @@ class InfoBar:
         self.rect = pygame.Rect(5, 5, SCREEN_WIDTH * 0.7, SCREEN_HEIGHT * 0.1)
         self.FONT_SIZE = 40
         self.mode = mode
-        self.font = pygame.font.SysFont("Arial", self.FONT_SIZE)
-        self.start_time = time.time()
-        self.paused_intervals: list[tuple[float, float]] = []
+        self.font = get_font('Arial', self.FONT_SIZE)
         if self.mode == REGULAR_PLAY:
             self.mode_text = 'Regular Play'
         else:
@@ -50,30 +50,29 @@ class InfoBar:
     def get_mode(self):
         return self.mode
 
+    def get_draw_state(self):
+        return (int(self.score), self.difficulty_level)
+
     def draw(self, screen: pygame.Surface):
         pygame.draw.rect(screen, GREY, self.rect)
         pygame.draw.rect(screen, BLACK, self.rect, 5, 2)
 
-        mode_text = self.font.render(
-            self.mode_text, True,  BLACK, GREY)
-        score_text = self.font.render(
-            f'Score: {int(self.score)}', True, BLACK, GREY)
-        difficulty_text = self.font.render(
-            f'Difficulty Level: {self.difficulty_level}', True, BLACK, GREY)
+        mode_text = render_text(self.font, self.mode_text, BLACK, GREY)
+        score_text = render_text(
+            self.font, f'Score: {int(self.score)}', BLACK, GREY)
+        difficulty_text = render_text(
+            self.font, f'Difficulty Level: {self.difficulty_level}', BLACK, GREY)
 
         screen.blit(mode_text, self.mode_rect)
         screen.blit(score_text, self.score_rect)
         screen.blit(difficulty_text, self.difficulty_rect)
 
     def update(self):
-        time_paused = self.get_time_paused()
-        self.score = time.time() - time_paused - self.start_time
+        pass
 
-    def get_time_paused(self):
-        time_paused = 0
-        for pair in self.paused_intervals:
-            time_paused += pair[1] - pair[0]
-        return time_paused
+    def fixed_update(self):
+        # Game time only moves with the simulation, so it stops while paused
+        self.score += SIMULATION_STEP
 
     def get_time_elapsed(self):
         return self.score
@@ -84,9 +83,6 @@ class InfoBar:
     def change_difficulty_level(self, delta):
         self.difficulty_level += delta
 
-    def add_pause_interval(self, paused_interval):
-        self.paused_intervals.append(paused_interval)
-
     def click(self, x, y):
         pass
 
@@ -96,19 +92,22 @@ class FrustrationBar:
         self.global_info_bar: InfoBar = global_info_bar
         self.tasklist: TaskList = tasklist
         self.frustration_level = 0
+        self.previous_frustration_level = 0
+        self.interpolation = 1
         self.mode = mode
         self.WIDTH = SCREEN_WIDTH * 0.05
         self.HEIGHT = SCREEN_HEIGHT * 0.85
         self.rect = pygame.Rect(SCREEN_WIDTH-self.WIDTH-40,
                                 SCREEN_HEIGHT*0.13, self.WIDTH, self.HEIGHT)
         self.FONT_SIZE = 30
-        self.font = pygame.font.SysFont("Arial", self.FONT_SIZE)
+        self.font = get_font('Arial', self.FONT_SIZE)
 
         self.label = self.font.render('User Frustration', True, BLACK, WHITE)
         self.label = pygame.transform.rotate(self.label, 270)
         self.text_rect = pygame.Rect(
             0, 0, self.label.get_width(), self.label.get_height())
         self.text_rect.center = (self.rect.centerx+63, self.rect.centery)
+        self.setup_overlay()
         self.new_target_time = 0
         self.target_reached = False
         self.number_of_tasks_forfeited = 0
@@ -118,18 +117,33 @@ class FrustrationBar:
 
     def draw(self, screen: pygame.Surface):
         red_rect = pygame.Rect(self.rect.left, 0, self.WIDTH,
-                               self.HEIGHT*0.01*self.frustration_level)
+                               self.get_bar_height())
         red_rect.bottom = self.rect.bottom
         pygame.draw.rect(screen, RED, red_rect)
 
-        pygame.draw.rect(screen, BLACK, self.rect, 5, 2)
+        screen.blit(self.overlay, self.rect)
+        screen.blit(self.label, self.text_rect)
+
+    def setup_overlay(self):
+        """Border and tick marks are drawn once onto a transparent surface that goes over the red bar"""
+        self.overlay = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        pygame.draw.rect(self.overlay, BLACK, self.overlay.get_rect(), 5, 2)
         for i in range(1, 10):
             i *= 0.1
-            dash_height = self.rect.top + i * self.HEIGHT
-            pygame.draw.line(screen, BLACK, (self.rect.left,
-                             dash_height), (self.rect.left+20, dash_height), 4)
+            dash_height = i * self.HEIGHT
+            pygame.draw.line(self.overlay, BLACK, (0,
+                             dash_height), (20, dash_height), 4)
 
-        screen.blit(self.label, self.text_rect)
+    def get_bar_height(self):
+        frustration_level = lerp(self.previous_frustration_level,
+                                 self.frustration_level, self.interpolation)
+        return self.HEIGHT*0.01*frustration_level
+
+    def get_draw_state(self):
+        return int(self.get_bar_height())
+
+    def set_interpolation(self, alpha):
+        self.interpolation = alpha
 
     def update(self):
         if self.mode == ZEN_MODE:
@@ -139,6 +153,10 @@ class FrustrationBar:
         if self.global_info_bar.get_time_elapsed() > self.new_target_time and self.target_reached:
             self.new_target()
 
+    def fixed_update(self):
+        self.previous_frustration_level = self.frustration_level
+        if self.mode == ZEN_MODE:
+            return
         distance_to_target = self.frustration_level - self.target
         if abs(distance_to_target) <= 1.5:
             self.frustration_level = self.target
@@ -206,6 +224,9 @@ class TaskList:
             task.draw(screen)
         pygame.draw.rect(screen, BLACK, self.rect, 5)
 
+    def get_draw_state(self):
+        return tuple((task, task.index) for task in self.tasks)
+
     def get_time_full(self):
         if self.start_time_full is None:
             return None
@@ -264,6 +285,43 @@ class TaskList:
         self.clicks_to_handle.append((x, y))
 
 
+class MinigamePool:
+    """Generates the puzzles of the highest priority tasks ahead of time, so starting a task doesn't stall the frame.
+
+    Only a minigame's generate() step, which is pure Python, runs early on a background thread. The minigame itself
+    is built when its task is started, as pygame's fonts and surfaces aren't safe to use from other threads"""
+    EXECUTOR = ThreadPoolExecutor(max_workers=1)  # Shared by every game, its thread starts on the first submit
+
+    def __init__(self, global_info_bar, task_list):
+        self.global_info_bar: InfoBar = global_info_bar
+        self.task_list: TaskList = task_list
+        self.generating: dict[Task, tuple[int, Future]] = {}  # task -> (seed, generate() result)
+
+    def prebuild(self):
+        for task in list(self.generating):  # Forget tasks no longer in the list
+            if task not in self.task_list.tasks:
+                self.generating.pop(task)[1].cancel()
+        upcoming = sorted(self.task_list.tasks, key=Task.get_priority,
+                          reverse=True)[:MINIGAME_PREBUILD_COUNT]
+        for task in upcoming:
+            minigame_class = Task.TASK_OBJECTS[task.description]
+            if task not in self.generating and hasattr(minigame_class, 'generate'):
+                # Seeded here so the puzzle doesn't depend on which thread generates it
+                seed = random.getrandbits(32)
+                self.generating[task] = (
+                    seed, self.EXECUTOR.submit(minigame_class.generate, seed))
+
+    def take(self, task):
+        """Returns a new minigame for task, using its generated puzzle if one was started"""
+        minigame_class = Task.TASK_OBJECTS[task.description]
+        if task not in self.generating:
+            return minigame_class(self.global_info_bar)
+        seed, future = self.generating.pop(task)
+        # Generating it here beats waiting for the thread to get through the queue first
+        layout = minigame_class.generate(seed) if future.cancel() else future.result()
+        return minigame_class(self.global_info_bar, layout)
+
+
 class Task:
     TASK_PRIORITIES = {
         'Register Mouse Inputs': 5,
@@ -302,8 +360,8 @@ class Task:
         self.HEIGHT = 103  # Odd number so 8 tasks nicely fit into the list
         self.rect = pygame.Rect(self.parent.rect.left, self.parent.rect.top + 1 +
                                 self.index*self.HEIGHT, self.parent.rect.width, self.HEIGHT)
-        self.description_font = pygame.font.SysFont('Arial', 35)
-        self.sub_font = pygame.font.SysFont('Arial', 25)
+        self.description_font = get_font('Arial', 35)
+        self.sub_font = get_font('Arial', 25)
         if description is None:
             self.description = random.choice(Task.TASK_DESCRIPTIONS)
         else:
@@ -340,8 +398,7 @@ class Task:
 
     def play_button_action(self):
         if isinstance(main_menu.get_game().get_minigame(), minigames.EmptyMiniGame):
-            main_menu.get_game().change_minigame(
-                Task.TASK_OBJECTS[self.description])
+            main_menu.get_game().start_task(self)
             self.parent.remove_task(self.index)
 
     def draw(self, screen: pygame.Surface):
@@ -380,11 +437,16 @@ class Task:
 
 
 class MainMenu:
-    def __init__(self):
+    def __init__(self, clock=None, profiler=None, score_uploader=None, leaderboard_store=None):
         pygame.init()
         pygame.display.set_caption('DoorsOS')
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        self.clock = pygame.time.Clock()
+        prewarm_fonts()
+        if PRELOAD_IMAGES:
+            preload_images()
+        # headless.py passes in a ScriptedClock to drive the game without a window
+        self.clock = pygame.time.Clock() if clock is None else clock
+        self.profiler: FrameProfiler | None = profiler
 
         self.play_button = Button(
             'Play game', SCREEN_WIDTH*0.5, SCREEN_HEIGHT*0.35, BLACK, GREY, 50, self.choose_difficulty)
@@ -416,8 +478,13 @@ class MainMenu:
 
         self.panels = [self.play_button,
                        self.leaderboard_button, self.learning_button, self.exit_button]
+        self.renderer = DirtyRectRenderer(self.screen)
         if SCHOOL_MODE:
             self.bypass_school_webwarning()
+        # headless.py passes in offline stand ins so test runs never reach the server or the saved files
+        # Starts sending any scores left over from last time
+        self.score_uploader = ScoreUploader() if score_uploader is None else score_uploader
+        self.leaderboard_store = LeaderBoardStore() if leaderboard_store is None else leaderboard_store
 
     def bypass_school_webwarning(self):
         url = "http://10.50.10.254:4100/wbo"
@@ -443,8 +510,10 @@ class MainMenu:
             mode = ZEN_MODE
 
         self.reset_panels()
-        self.game = DoorsOS(self.clock, self.screen, difficulty, mode)
+        self.game = DoorsOS(self.clock, self.screen,
+                            difficulty, mode, self.profiler)
         self.game.play_game()
+        self.renderer.force_full_redraw()
         exit_code = self.game.get_exit_code()
         if exit_code == pygame.QUIT:
             self.running = False
@@ -452,13 +521,16 @@ class MainMenu:
     def learning_mode(self):
         self.learning = LearningMode(self.clock, self.screen)
         self.learning.run()
+        self.renderer.force_full_redraw()
         exit_code = self.learning.get_exit_code()
         if exit_code == pygame.QUIT:
             self.running = False
 
     def leaderboard(self):
-        self.leaderboard_screen = LeaderBoardScreen(self.clock, self.screen)
+        self.leaderboard_screen = LeaderBoardScreen(
+            self.clock, self.screen, self.leaderboard_store)
         self.leaderboard_screen.run()
+        self.renderer.force_full_redraw()
         exit_code = self.leaderboard_screen.get_exit_code()
         if exit_code == pygame.QUIT:
             self.running = False
@@ -500,11 +572,7 @@ class MainMenu:
             panel.update()
 
     def update_screen(self):
-        self.screen.fill(WHITE)
-        for panel in self.panels:
-            panel.draw(self.screen)
-
-        pygame.display.update()
+        self.renderer.render(self.panels)
 
     def send_click_to_panel(self, event: pygame.event.Event):
         x, y = event.pos
@@ -517,9 +585,13 @@ class MainMenu:
 
 
 class DoorsOS:
-    def __init__(self, clock, screen, difficulty, mode):
+    def __init__(self, clock, screen, difficulty, mode, profiler=None):
         self.clock = clock
+        self.profiler: FrameProfiler | None = profiler
         self.screen: pygame.Surface = screen
+        self.renderer = DirtyRectRenderer(self.screen)
+        self.timestep = FixedTimestep()
+        self.frame_time = SIMULATION_STEP  # Seconds the previous frame took
         self.exit_code = 0
         self.mode = mode
         self.difficulty = difficulty
@@ -534,6 +606,7 @@ class DoorsOS:
         self.paused = False
         self.info_bar = InfoBar(self.mode)
         self.task_list = TaskList(self.info_bar)
+        self.minigame_pool = MinigamePool(self.info_bar, self.task_list)
         self.frustration_bar = FrustrationBar(
             self.task_list, self.mode, self.info_bar)
         self.current_mini_game = minigames.EmptyMiniGame(self.info_bar)
@@ -548,7 +621,6 @@ class DoorsOS:
         self.reset_game()
         self.game_running = True
         self.new_diff_increase_time()
-        paused_interval = 0
         while self.game_running:
             for event in pygame.event.get():
                 self.current_mini_game.take_event(event)
@@ -564,17 +636,26 @@ class DoorsOS:
 
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_ESCAPE:
-                        paused_interval = self.pause_game()
-                        self.info_bar.add_pause_interval(paused_interval)
+                        self.pause_game()
+                    if event.key == pygame.K_F3 and self.profiler is not None:
+                        self.profiler.toggle_hud()
+                        self.renderer.force_full_redraw()
 
             if not self.game_running:
                 break
 
             pygame.display.set_caption(
                 f'DoorsOS {round(self.clock.get_fps())}fps')
+            if self.profiler is not None:
+                self.profiler.start_frame()
             self.update_panels()
             self.update_screen()
-            self.clock.tick(FPS)
+            if self.profiler is None:
+                self.minigame_pool.prebuild()
+            else:
+                self.profiler.time('MinigamePool.prebuild',
+                                   self.minigame_pool.prebuild)
+            self.frame_time = self.clock.tick(FPS)/1000
 
     def exit_to_main_menu(self, complete_exit=False):
         self.game_running = False
@@ -583,7 +664,13 @@ class DoorsOS:
         self.unpause_game()
 
     def change_minigame(self, minigame):
-        self.current_mini_game = minigame(self.info_bar)
+        self.set_minigame(minigame(self.info_bar))
+
+    def start_task(self, task):
+        self.set_minigame(self.minigame_pool.take(task))
+
+    def set_minigame(self, minigame: minigames.MiniGame):
+        self.current_mini_game = minigame
         self.panels[1] = self.current_mini_game
 
     def increase_difficulty_level(self):
@@ -598,11 +685,26 @@ class DoorsOS:
             time_till_change = random.randint(25, 35)
             self.next_diff_increase_time = self.info_bar.get_time_elapsed()+time_till_change
 
+    def fixed_update_panels(self):
+        for panel in (self.info_bar, self.current_mini_game, self.frustration_bar):
+            if self.profiler is None:
+                panel.fixed_update()
+            else:
+                self.profiler.time_panel(panel, 'fixed_update')
+
     def update_panels(self):
+        for _ in range(self.timestep.advance(self.frame_time)):
+            self.fixed_update_panels()
+        self.current_mini_game.set_interpolation(self.timestep.alpha)
+        self.frustration_bar.set_interpolation(self.timestep.alpha)
+
         if self.info_bar.get_time_elapsed() > self.next_diff_increase_time:
             self.increase_difficulty_level()
         for panel in self.panels:
-            panel.update()
+            if self.profiler is None:
+                panel.update()
+            else:
+                self.profiler.time_panel(panel, 'update')
 
         if self.current_mini_game.ready_to_exit:
             if self.current_mini_game.forfeited:
@@ -613,15 +715,20 @@ class DoorsOS:
             self.game_over_screen()
 
     def update_screen(self):
-        self.screen.fill(WHITE)
-        for panel in self.panels:
-            panel.draw(self.screen)
+        if self.profiler is None:
+            self.renderer.render(self.panels)
+        else:
+            self.profiler.time('update_screen', self.renderer.render, self.panels,
+                               self.draw_panel_profiled, None, self.draw_profiler_hud)
 
-        pygame.display.update()
+    def draw_panel_profiled(self, panel):
+        self.profiler.time_panel(panel, 'draw', self.screen)
+
+    def draw_profiler_hud(self):
+        return self.profiler.draw_hud(self.screen)
 
     def pause_game(self):
         self.paused = True
-        start_time = time.time()
         self.panels = [self.info_bar,
                        self.resume_button, self.end_game_button]
         while self.paused:
@@ -642,7 +749,6 @@ class DoorsOS:
 
         self.panels = [
             self.info_bar, self.current_mini_game, self.frustration_bar, self.task_list]
-        return (start_time, time.time())
 
     def game_over_screen(self):
         if self.mode == ZEN_MODE:
@@ -650,7 +756,7 @@ class DoorsOS:
             self.exit_to_main_menu()
         self.panels = [self.info_bar, self.submit_button]
         self.name = ''
-        font = pygame.font.SysFont('Arial', 50)
+        font = get_font('Arial', 50)
         message_1 = font.render('Game Over!', True, BLACK, WHITE)
         message_2 = font.render(
             'If you want to upload your score to the leaderboard, enter a name, otherwise just press submit', True, BLACK, WHITE)
@@ -679,7 +785,7 @@ class DoorsOS:
                     if event.button == 1:
                         self.send_click_to_panel(event)
 
-            rendered_name = font.render(self.name, True, BLACK, GREY)
+            rendered_name = render_text(font, self.name, BLACK, GREY)
 
             self.screen.fill(WHITE)
             for panel in self.panels:
@@ -703,13 +809,10 @@ class DoorsOS:
                 'score': int(self.info_bar.get_time_elapsed()),
                 'difficulty': 'A-Level' if self.difficulty else 'GCSE',
                 'date': date.today().strftime(r'%d-%m-%Y'),
-                'actual_user': os.getlogin()
+                # Unlike os.getlogin() this still works without a controlling terminal
+                'actual_user': getpass.getuser()
             }
-            r = requests.post(
-                'http://140.238.101.107/doorsos/new.php', data=payload)
-            if r.status_code != 200:
-                print(
-                    f'Score upload failed with code {r.status_code}, {SCHOOL_MODE=}')
+            main_menu.score_uploader.submit(payload)
         self.exit_to_main_menu()
 
     def send_click_to_panel(self, event: pygame.event.Event):
@@ -779,6 +882,7 @@ class LearningMode:
         self.exit_code = 0
         self.clock = clock
         self.screen = screen
+        self.renderer = DirtyRectRenderer(self.screen)
 
     def buttons_to_panels(self):
         self.panels = [self.RMI_button,
@@ -822,10 +926,7 @@ class LearningMode:
             self.clock.tick(FPS)
 
     def update_screen(self):
-        self.screen.fill(WHITE)
-        for panel in self.panels:
-            panel.draw(self.screen)
-        pygame.display.update()
+        self.renderer.render(self.panels)
 
     def send_click_to_panel(self, event: pygame.event.Event):
         x, y = event.pos
@@ -862,13 +963,13 @@ class LearningMode:
 
 
 class LeaderBoardScreen:
-    def __init__(self, clock, screen):
+    def __init__(self, clock, screen, leaderboard_store):
         self.clock = clock
         self.screen = screen
         self.exit_code = 0
 
         font_size = 30
-        self.font = pygame.font.SysFont('Arial', font_size, False, False)
+        self.font = get_font('Arial', font_size)
 
         self.time_period_text = self.font.render(
             'Time period:', True, BLACK, WHITE)
@@ -917,10 +1018,11 @@ class LeaderBoardScreen:
         self.back_button = Button(
             'Back', 50, 30, BLACK, GREY, font_size, self.exit)
 
-        self.leaderboard = LeaderBoard()
+        self.leaderboard = LeaderBoard(leaderboard_store)
 
         self.panels = [self.back_button, self.leaderboard]
         self.panels.extend(self.filter_buttons)
+        self.renderer = DirtyRectRenderer(self.screen)
 
     def update_time_period(self):
         for button in self.time_buttons:
@@ -957,17 +1059,16 @@ class LeaderBoardScreen:
                 break
             pygame.display.set_caption(
                 f'DoorsOS {round(self.clock.get_fps())}fps')
+            self.leaderboard.update()
             self.update_screen()
             self.clock.tick(FPS)
 
     def update_screen(self):
-        self.screen.fill(WHITE)
-        for panel in self.panels:
-            panel.draw(self.screen)
+        self.renderer.render(self.panels, draw_static=self.draw_labels)
 
+    def draw_labels(self):
         self.screen.blit(self.time_period_text, self.time_period_text_rect)
         self.screen.blit(self.difficulty_text, self.difficulty_text_rect)
-        pygame.display.update()
 
     def send_click_to_panel(self, event: pygame.event.Event):
         x, y = event.pos
@@ -978,5 +1079,7 @@ class LeaderBoardScreen:
 
 if __name__ == '__main__':
     os.chdir(os.path.dirname(__file__))
-    main_menu = MainMenu()
+    main_menu = MainMenu(profiler=FrameProfiler() if PROFILE else None)
     main_menu.run()
+    if PROFILE:
+        main_menu.profiler.dump('profile.csv')
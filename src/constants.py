@@ -1,4 +1,5 @@
 from math import radians
+from hashlib import sha1
 from datetime import datetime
 import random
 from string import ascii_lowercase
@@ -12,16 +13,18 @@ RED = (240, 29, 29)
 GREEN = (48, 194, 0)
 BLUE = (5, 148, 237)
 FPS = 60
+SIMULATION_STEP = 1/FPS  # Movement speeds were tuned per frame at 60fps
+MAX_STEPS_PER_FRAME = 8
+# Highest priority tasks whose puzzles are generated ahead of time
+MINIGAME_PREBUILD_COUNT = 2
 GCSE = 0
 ALEVEL = 1
 REGULAR_PLAY = 0
 ZEN_MODE = 1
 MINIGAME = 0
 MM_GRAVITY = 1
-DD_TILE_CENTERS = [(429, 238), (429, 288), (429, 338), (429, 388), (429, 438), (429, 488), (429, 538), (429, 588), (479, 238), (479, 288), (479, 338), (479, 388), (479, 438), (479, 488), (479, 538), (479, 588), (529, 238), (529, 288), (529, 338), (529, 388), (529, 438), (529, 488), (529, 538), (529, 588), (579, 238), (579, 288), (579, 338), (579, 388), (579, 438), (579, 488), (579, 538), (
-    579, 588), (629, 238), (629, 288), (629, 338), (629, 388), (629, 438), (629, 488), (629, 538), (629, 588), (679, 238), (679, 288), (679, 338), (679, 388), (679, 438), (679, 488), (679, 538), (679, 588), (729, 238), (729, 288), (729, 338), (729, 388), (729, 438), (729, 488), (729, 538), (729, 588), (779, 238), (779, 288), (779, 338), (779, 388), (779, 438), (779, 488), (779, 538), (779, 588)]
-DD_TILE_CENTERS_TO_COORDS = dict(
-    zip(DD_TILE_CENTERS, ((x, y) for x in range(8) for y in range(8))))
+DD_GRID_WIDTH, DD_GRID_HEIGHT = 8, 8
+DD_MIN_BLOCK_SIZE, DD_MAX_BLOCK_SIZE = 1, 6
 UA_USERNAMES = ['Alice',
                 'Bob',
                 'James',
@@ -41,7 +44,27 @@ UA_USERNAMES = ['Alice',
                 'Jayden',
                 'Katie',
                 'Leo',
-                'Sam']
+                'Sam',
+                'Priya',
+                'Tom',
+                'Chloe',
+                'Mohammed',
+                'Ruby',
+                'Daniel',
+                'Grace',
+                'Ethan',
+                'Zara',
+                'Harry',
+                'Isla',
+                'Noah',
+                'Amelia',
+                'Kai',
+                'Freya',
+                'Yusuf',
+                'Lily',
+                'Max',
+                'Aisha',
+                'Theo']
 UA_PASSWORDS = ['password',
                 'qwerty',
                 'p@$$w0rd',
@@ -63,6 +86,11 @@ UA_PASSWORDS = ['password',
                 'iluvdogs',
                 'x@6a8qDU',
                 'hash_brown']
+UA_HASHES = {password: sha1(password.encode(
+    'utf-8')).hexdigest()[0:10] for password in UA_PASSWORDS}
+UA_ACTIVE_USERS = 10  # Users on the clipboard
+OD_TARGET_CROSSINGS = (1, 6)  # Range the scrambled puzzle's crossing count is aimed at, keeps it solvable in 20s
+OD_SCRAMBLE_STEPS = 60
 UA_TICK = 0
 UA_CROSS = 1
 UA_LOCK = 2
@@ -71,6 +99,10 @@ BF_COPY = 1
 CS_ANGLE_DELTA = radians(360/26)
 CS_ANGLES = [i*CS_ANGLE_DELTA for i in range(27)]
 CS_ANGLE_TO_INDEX = {angle: idx for idx, angle in enumerate(CS_ANGLES)}
+# A dragged wheel is drawn rounded to half a letter, so every other step is a snap position.
+# The cache holds the in between steps of half a turn, the furthest any shift needs to go
+CS_ROTATION_STEP = CS_ANGLE_DELTA/2
+CS_ROTATION_CACHE_SIZE = 13
 CS_PHRASES = ['The mitochondria is the powerhouse of the cell',
 
               'RAM needs power to keep its contents',
@@ -92,7 +124,9 @@ CS_PHRASES = ['The mitochondria is the powerhouse of the cell',
               f'Don\'t use {random.choice(["VBA", "COBOL", "Perl", "Pascal", "Fortran", "BASIC"])} in {datetime.now().year}',
               'You don\'t reuse passwords do you?'
               ]
-DC_GRID_TOP_LEFT = ((MINIGAME_WIDTH/2)-(5.5*50), MINIGAME_HEIGHT-(50*13)-7)
+DC_GRID_WIDTH, DC_GRID_HEIGHT = 11, 13
+DC_GRID_TOP_LEFT = ((MINIGAME_WIDTH/2)-(DC_GRID_WIDTH/2*50),
+                    MINIGAME_HEIGHT-(50*DC_GRID_HEIGHT)-7)
 # DC_TILES[PIECE_NAME][ROTATION_STATE] -> list of tile coords
 DC_TILES = {
     'straight': {0: [(0, 2), (1, 2), (2, 2), (3, 2)],
@@ -124,7 +158,27 @@ DC_TILES = {
                  2: [(0, 2), (1, 2), (1, 1), (2, 1)],
                  3: [(1, 0), (1, 1), (2, 1), (2, 2)]}
 }
+# DC_PIECE_MASKS[PIECE_NAME][ROTATION_STATE] -> (min x, max x, ((y, bitmask of x coords in that row), ...))
+DC_PIECE_MASKS = {name: {rotation: (min(x for x, _ in tiles), max(x for x, _ in tiles),
+                                    tuple((y, sum(1 << x for x, tile_y in tiles if tile_y == y))
+                                          for y in sorted({y for _, y in tiles})))
+                         for rotation, tiles in rotations.items()}
+                  for name, rotations in DC_TILES.items()}
+# Offsets tried in order when rotating, so a piece against a wall shifts over rather than refusing to turn
+DC_WALL_KICKS = {name: [(0, 0), (-1, 0), (1, 0)] for name in DC_TILES}
+DC_WALL_KICKS['straight'] = [(0, 0), (-1, 0), (1, 0), (-2, 0), (2, 0)]
+# Every (face, size) the game uses, loaded at startup so making panels doesn't hit the disk
+PREWARMED_FONTS = [('Arial', size) for size in (20, 24, 25, 29, 30, 35, 40, 50, 70)]
 PYGAME_KEY_TO_LETTER = {i+97: letter for i,
                         letter in enumerate(ascii_lowercase)}
+SERVER_URL = 'http://140.238.101.107/doorsos/'
+SCORE_JOURNAL_PATH = 'score_journal.json'  # Scores waiting to be uploaded
+LEADERBOARD_CACHE_PATH = 'leaderboard_cache.json'  # Last leaderboard downloaded, shown while checking for a newer one
+LEADERBOARD_ROWS = 20
+UPLOAD_TIMEOUT = 10  # Seconds, also used for leaderboard downloads
+UPLOAD_RETRY_DELAYS = (2, 300)  # Seconds waited after the first failed upload, doubling up to the max
+UPLOAD_MAX_SERVER_ERRORS = 8  # A score the server keeps failing on is dropped after this many 5xx responses
 SCHOOL_MODE = False
 DEBUG = False
+PRELOAD_IMAGES = True  # Load every image at startup rather than when first used
+PROFILE = False  # Time each panel, F3 toggles the HUD, trace is written to profile.csv on exit
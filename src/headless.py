@@ -0,0 +1,258 @@
+import sys
+sys.dont_write_bytecode = True
+import os
+import json
+import random
+import time
+import argparse
+import pygame
+from constants import *
+from profiler import FrameProfiler
+from utils import DCAutoPlayer, LeaderBoardStore
+
+
+class ScriptedClock:
+    """Drop in replacement for pygame.time.Clock that feeds scripted/random input into the event queue"""
+    MONKEY_KEYS = [pygame.K_w, pygame.K_a, pygame.K_s,
+                   pygame.K_d, pygame.K_q, pygame.K_e]
+
+    def __init__(self, script=None, max_frames=None, capped=False, monkey_rate=0, seed=None):
+        self.clock = pygame.time.Clock()
+        self.frame = 0
+        self.max_frames = max_frames
+        self.capped = capped
+        self.monkey_rate = monkey_rate
+        self.random = random.Random(seed)
+        self.mouse_pos = (0, 0)
+        # Script entries are delivered after the tick of the frame they name
+        self.script = sorted(script or [], key=lambda x: x['frame'])
+        self.start_time = time.perf_counter()
+
+    def tick(self, framerate=0):
+        self.frame += 1
+        if self.capped:
+            ms = self.clock.tick(framerate)
+        else:
+            self.clock.tick()
+            # Report the frame as having taken exactly one frame at the target rate,
+            # so the game simulates a full step per frame however fast it is really running
+            ms = 1000/framerate if framerate else self.clock.get_time()
+
+        while self.script and self.script[0]['frame'] <= self.frame:
+            self.post_scripted_event(self.script.pop(0))
+        if self.monkey_rate and self.random.random() < self.monkey_rate:
+            self.post_monkey_event()
+        if self.max_frames is not None and self.frame >= self.max_frames:
+            pygame.event.post(pygame.event.Event(pygame.QUIT))
+        return ms
+
+    def get_fps(self):
+        fps = self.clock.get_fps()
+        # Uncapped frames can take under a millisecond, which pygame reports as infinite fps
+        return fps if fps != float('inf') else 0
+
+    def get_time(self):
+        return self.clock.get_time()
+
+    def get_elapsed(self):
+        return time.perf_counter()-self.start_time
+
+    def post_mouse_motion(self, pos, buttons=(0, 0, 0)):
+        pos = tuple(pos)
+        rel = (pos[0]-self.mouse_pos[0], pos[1]-self.mouse_pos[1])
+        self.mouse_pos = pos
+        pygame.event.post(pygame.event.Event(
+            pygame.MOUSEMOTION, pos=pos, rel=rel, buttons=buttons))
+
+    def post_mouse_button(self, event_type, pos, button=1):
+        self.post_mouse_motion(pos)
+        pygame.event.post(pygame.event.Event(
+            event_type, pos=tuple(pos), button=button))
+
+    def post_key(self, event_type, key):
+        if isinstance(key, str):
+            key = pygame.key.key_code(key)
+        pygame.event.post(pygame.event.Event(
+            event_type, key=key, mod=0, unicode='', scancode=0))
+
+    def post_scripted_event(self, entry):
+        event_type = entry['type']
+        if event_type == 'click':
+            self.post_mouse_button(pygame.MOUSEBUTTONDOWN,
+                                   entry['pos'], entry.get('button', 1))
+            self.post_mouse_button(pygame.MOUSEBUTTONUP,
+                                   entry['pos'], entry.get('button', 1))
+        elif event_type == 'mousedown':
+            self.post_mouse_button(pygame.MOUSEBUTTONDOWN,
+                                   entry['pos'], entry.get('button', 1))
+        elif event_type == 'mouseup':
+            self.post_mouse_button(pygame.MOUSEBUTTONUP,
+                                   entry['pos'], entry.get('button', 1))
+        elif event_type == 'motion':
+            self.post_mouse_motion(entry['pos'])
+        elif event_type == 'key':
+            self.post_key(pygame.KEYDOWN, entry['key'])
+            self.post_key(pygame.KEYUP, entry['key'])
+        elif event_type == 'keydown':
+            self.post_key(pygame.KEYDOWN, entry['key'])
+        elif event_type == 'keyup':
+            self.post_key(pygame.KEYUP, entry['key'])
+        elif event_type == 'quit':
+            pygame.event.post(pygame.event.Event(pygame.QUIT))
+        else:
+            raise ValueError(f'Unknown scripted event type {event_type}')
+
+    def post_monkey_event(self):
+        """Random input used for soak testing"""
+        choice = self.random.random()
+        pos = (self.random.randint(0, int(SCREEN_WIDTH)-1),
+               self.random.randint(0, int(SCREEN_HEIGHT)-1))
+        if choice < 0.5:
+            self.post_mouse_button(pygame.MOUSEBUTTONDOWN, pos)
+            self.post_mouse_button(pygame.MOUSEBUTTONUP, pos)
+        elif choice < 0.8:
+            self.post_mouse_button(pygame.MOUSEBUTTONDOWN, self.mouse_pos)
+            self.post_mouse_motion(pos, (1, 0, 0))
+            self.post_mouse_button(pygame.MOUSEBUTTONUP, pos)
+        else:
+            key = self.random.choice(ScriptedClock.MONKEY_KEYS)
+            self.post_key(pygame.KEYDOWN, key)
+            self.post_key(pygame.KEYUP, key)
+
+
+class OfflineScoreUploader:
+    """Stands in for ScoreUploader, keeping submitted scores in memory instead of sending them"""
+
+    def __init__(self):
+        self.submitted: list[dict] = []
+
+    def submit(self, payload: dict):
+        self.submitted.append(payload)
+
+
+class OfflineLeaderBoardStore(LeaderBoardStore):
+    """Never downloads or reads the saved cache, so the leaderboard is always empty"""
+
+    def load_cache(self):
+        return {}
+
+    def refresh(self, key, params):
+        pass
+
+
+def load_script(path):
+    if path is None:
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run DoorsOS without a window for soak tests and benchmarks')
+    parser.add_argument('--start', choices=['menu', 'regular', 'zen'], default='regular',
+                        help='Start at the main menu or jump straight into a game')
+    parser.add_argument('--difficulty', choices=['gcse', 'alevel'], default='gcse')
+    parser.add_argument('--frames', type=int, default=3600,
+                        help='Quit after this many frames')
+    parser.add_argument('--script', default=None,
+                        help='JSON list of {"frame", "type", ...} input events')
+    parser.add_argument('--monkey', type=float, default=0,
+                        help='Chance per frame of a random click, drag or key press')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--capped', action='store_true',
+                        help=f'Keep the normal {FPS}fps cap')
+    parser.add_argument('--profile', default=None,
+                        help='Write a per-frame, per-panel timing trace to this .csv or .json file')
+    parser.add_argument('--hud', action='store_true',
+                        help='Draw the profiler HUD (implies profiling)')
+    parser.add_argument('--show-window', action='store_true',
+                        help='Use the real video driver instead of the dummy one')
+    parser.add_argument('--dc-benchmark', type=int, default=0, metavar='GAMES',
+                        help='Instead of a session, let the bot play this many Data Compression games per board size')
+    parser.add_argument('--dc-sizes', nargs='+', default=[f'{DC_GRID_WIDTH}x{DC_GRID_HEIGHT}'],
+                        help='Board sizes for --dc-benchmark, as WIDTHxHEIGHT')
+    parser.add_argument('--dc-blocks', type=int, default=500,
+                        help='Most blocks per --dc-benchmark game, as the bot can play forever')
+    return parser.parse_args(argv)
+
+
+def run_dc_benchmark(games, sizes, max_blocks):
+    import DoorsOS
+    import minigames
+    info_bar = DoorsOS.InfoBar(REGULAR_PLAY)  # Game time never advances so blocks only fall when dropped
+    for size in sizes:
+        width, height = (int(x) for x in size.split('x'))
+        bot = DCAutoPlayer()
+        blocks = rows_cleared = 0
+        lock_time = 0
+        start_time = time.perf_counter()
+        for _ in range(games):
+            minigame = minigames.DataCompression(info_bar, width, height)
+            minigame.row_clear_target = float('inf')  # Play until overflow or max_blocks
+            for _ in range(max_blocks):
+                if not minigame.running:
+                    break
+                bot.play_block(minigame)
+                # Locking the block in place is where rows are cleared
+                lock_start = time.perf_counter()
+                minigame.update()
+                lock_time += time.perf_counter()-lock_start
+                blocks += 1
+            rows_cleared += minigame.num_rows_cleared
+        elapsed = time.perf_counter()-start_time
+        print(f'{size}: {games} games, {blocks} blocks, {rows_cleared} rows cleared in {elapsed:.2f}s, '
+              f'{bot.placements_evaluated/elapsed:.0f} placements/s, '
+              f'{1000*lock_time/max(blocks, 1):.3f}ms per block lock and row clear')
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if not args.show_window:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    import DoorsOS
+    clock = ScriptedClock(load_script(args.script), args.frames,
+                          args.capped, args.monkey, args.seed)
+    profiler = None
+    if args.profile is not None or args.hud:
+        profiler = FrameProfiler(show_hud=args.hud)
+    score_uploader = OfflineScoreUploader()
+    DoorsOS.main_menu = main_menu = DoorsOS.MainMenu(
+        clock, profiler, score_uploader, OfflineLeaderBoardStore())
+
+    if args.dc_benchmark:
+        run_dc_benchmark(args.dc_benchmark, args.dc_sizes, args.dc_blocks)
+        pygame.quit()
+        return
+
+    if args.start == 'menu':
+        main_menu.run()
+    else:
+        if args.difficulty == 'alevel':
+            main_menu.alevel_button.click()
+        if args.start == 'zen':
+            main_menu.zen_button.click()
+        main_menu.play_game()
+
+    elapsed = clock.get_elapsed()
+    print(f'{clock.frame} frames in {elapsed:.2f}s '
+          f'({clock.frame/elapsed:.0f}fps, {clock.frame/(elapsed*FPS):.1f}x the {FPS}fps cap)')
+    if score_uploader.submitted:
+        print(f'{len(score_uploader.submitted)} scores submitted, not sent')
+    if args.start != 'menu':
+        print(f'{main_menu.get_game().info_bar.get_time_elapsed():.1f}s of game time simulated')
+    if profiler is not None:
+        for name, values in sorted(profiler.get_summary().items()):
+            print(f'{name:<32} p50 {values["p50"]:.2f}ms  p95 {values["p95"]:.2f}ms  p99 {values["p99"]:.2f}ms')
+        if args.profile is not None:
+            profiler.dump(args.profile)
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,9 @@
-from hashlib import sha1
 import pygame
 from constants import *
 from utils import *
-from copy import copy, deepcopy
-from itertools import cycle, combinations, pairwise
-from math import cos, pi, sin, atan2
+from copy import copy
+from itertools import cycle
+from math import pi, atan2
 from functools import reduce
 import operator
 from string import ascii_lowercase, ascii_uppercase
@@ -22,8 +21,8 @@ class MiniGame:
         self.sub_rect = pygame.Rect(
             0, 0, MINIGAME_WIDTH, MINIGAME_HEIGHT)
         self.clicks_to_handle = []
-        self.font = pygame.font.SysFont('Arial', 70)
-        self.instruction_font = pygame.font.SysFont('Arial', 40)
+        self.font = get_font('Arial', 70)
+        self.instruction_font = get_font('Arial', 40)
         self.forfeit_button = Button(
             'Forfeit', self.sub_rect.right-70, self.sub_rect.top+40, BLACK, GREY, 40, self.question_forfeit)
         self.confirm_forfeit_button = Button(
@@ -37,10 +36,14 @@ class MiniGame:
         self.questioning_forfeit = False
         self.countdown_start_time = None
         self.forfeited = False
+        self.interpolation = 1
 
     def draw(self, screen: pygame.Surface):
         raise NotImplementedError('Can\'t draw base minigame')
 
+    def get_draw_state(self):
+        return None  # Minigames animate so are redrawn every frame
+
     def draw_border(self):
         pygame.draw.rect(self.sub_surface, BLACK, self.sub_rect, 5, 1)
 
@@ -80,6 +83,13 @@ class MiniGame:
     def update(self):
         raise NotImplementedError('Can\'t update base minigame')
 
+    def fixed_update(self):
+        """Called once per simulation step, minigames with moving objects move them here"""
+        pass
+
+    def set_interpolation(self, alpha):
+        self.interpolation = alpha
+
     def question_forfeit(self):
         self.questioning_forfeit = True
 
@@ -169,6 +179,9 @@ class EmptyMiniGame(MiniGame):
     def update(self):
         self.clicks_to_handle = []
 
+    def get_draw_state(self):
+        return ()
+
 
 class RegisterMouseInputs(MiniGame):
     def __init__(self, global_info_bar):
@@ -183,7 +196,7 @@ class RegisterMouseInputs(MiniGame):
 
         self.sub_surface.fill(WHITE)
         for button in self.buttons.values():
-            button.draw(self.sub_surface)
+            button.draw(self.sub_surface, self.interpolation)
 
         self.info_bar.draw(self.sub_surface)
 
@@ -200,9 +213,6 @@ class RegisterMouseInputs(MiniGame):
             self.buttons[RMIButton.ID-1] = RMIButton(
                 10, self.handle_clicked_button, self.sub_rect, self.delete_button)
 
-        for button in copy(self.buttons).values():  # Update buttons for motion
-            button.update()
-
         while self.clicks_to_handle:
             x, y = self.clicks_to_handle.pop(0)
             click_used = False
@@ -222,6 +232,12 @@ class RegisterMouseInputs(MiniGame):
             if click_used:
                 continue
 
+    def fixed_update(self):
+        if not self.running:
+            return
+        for button in copy(self.buttons).values():  # Update buttons for motion
+            button.fixed_update()
+
     def handle_clicked_button(self, button_id):
         button: RMIButton = self.buttons[button_id]
         if button.scam:
@@ -252,12 +268,13 @@ class MemoryManagement(MiniGame):
         self.out_of_garbage = False
         self.setup_bins()
         self.setup_walls()
+        self.setup_background()
         self.garbage_dict: dict[int, MMGarbage] = {}
         self.add_garbage()
 
     @property
     def garbage_left_text(self):
-        return self.instruction_font.render(f'Garbage Left: {self.get_garbage_left()}', True, BLACK)
+        return render_text(self.instruction_font, f'Garbage Left: {self.get_garbage_left()}', BLACK)
 
     @property
     def catapult_garbage(self):
@@ -270,12 +287,10 @@ class MemoryManagement(MiniGame):
         if not self.running:
             return self.draw_ending_screen(screen)
 
-        self.sub_surface.fill(WHITE)
-
-        pygame.draw.rect(self.sub_surface, BLACK, pygame.Rect(
-            0, MINIGAME_HEIGHT*0.55, 250, 10), 0, 2)
-        self.draw_bin_backs(self.sub_surface)
-        self.catapult_back.draw(self.sub_surface)
+        self.sub_surface.blit(self.background, (0, 0))
+        if DEBUG:  # Bin highlights
+            self.draw_bin_backs(self.sub_surface)
+            self.catapult_back.draw(self.sub_surface)
         self.draw_garbage(self.sub_surface)
         self.draw_bin_fronts(self.sub_surface)
         self.catapult_front.draw(self.sub_surface)
@@ -299,12 +314,6 @@ class MemoryManagement(MiniGame):
                 self.ending_message_rect = self.ending_message.get_rect(
                     center=self.sub_rect.center)
 
-        for wall in self.walls:
-            wall.update()
-
-        for garbage in copy(self.garbage_dict).values():
-            garbage.update()
-
         while self.clicks_to_handle:
             x, y = self.clicks_to_handle.pop(0)
             click_used = False
@@ -323,6 +332,15 @@ class MemoryManagement(MiniGame):
             if click_used:
                 continue
 
+    def fixed_update(self):
+        if not self.running:
+            return
+        for wall in self.walls:
+            wall.fixed_update()
+
+        for garbage in copy(self.garbage_dict).values():
+            garbage.fixed_update()
+
     def setup_bins(self):
         scores = [10, 20, 30, 40, 30, 20, 10, 50]
         self.bins: list[MMBin] = []
@@ -330,6 +348,15 @@ class MemoryManagement(MiniGame):
             bin = MMBin(460+98*i, MINIGAME_HEIGHT*0.902, scores.pop(0))
             self.bins.append(bin)
 
+    def setup_background(self):
+        """Catapult platform, bin backs and catapult back never move so are drawn once"""
+        self.background = pygame.Surface(self.rect.size)
+        self.background.fill(WHITE)
+        pygame.draw.rect(self.background, BLACK, pygame.Rect(
+            0, MINIGAME_HEIGHT*0.55, 250, 10), 0, 2)
+        self.draw_bin_backs(self.background)
+        self.catapult_back.draw(self.background)
+
     def draw_bin_backs(self, screen):
         for bin in self.bins:
             bin.draw_back(screen)
@@ -340,11 +367,11 @@ class MemoryManagement(MiniGame):
 
     def draw_garbage(self, screen):
         for garbage in self.garbage_dict.values():
-            garbage.draw(screen)
+            garbage.draw(screen, self.interpolation)
 
     def draw_walls(self, screen):
         for wall in self.walls:
-            wall.draw(screen)
+            wall.draw(screen, self.interpolation)
 
     def add_garbage(self):
         self.garbage_left -= 1
@@ -399,26 +426,36 @@ class MemoryManagement(MiniGame):
 
 
 class DefragDisk(MiniGame):
-    def __init__(self, global_info_bar):
-        super().__init__(global_info_bar)
-        self.occupied_tiles = set()
-        self.cell_size = 50
-        grid_size = self.cell_size*8
+    @staticmethod
+    def generate(seed):
+        """Returns the block arrangements, pure Python so MinigamePool can run it on a background thread"""
+        return partition_grid(DD_GRID_WIDTH, DD_GRID_HEIGHT, DD_MIN_BLOCK_SIZE, DD_MAX_BLOCK_SIZE, seed)
 
-        self.grid_rect = pygame.Rect(self.sub_rect.centerx-(grid_size/2),
-                                     self.sub_rect.centery-(grid_size/2), grid_size, grid_size)
+    def __init__(self, global_info_bar, block_arrangements=None):
+        super().__init__(global_info_bar)
+        self.grid_width, self.grid_height = DD_GRID_WIDTH, DD_GRID_HEIGHT
+        # Boards bigger than 8x8 use smaller tiles so they still fit between the block columns
+        self.cell_size = min(50, 400//max(self.grid_width, self.grid_height))
+        grid_width = self.cell_size*self.grid_width
+        grid_height = self.cell_size*self.grid_height
+
+        self.grid_rect = pygame.Rect(self.sub_rect.centerx-(grid_width/2),
+                                     self.sub_rect.centery-(grid_height/2), grid_width, grid_height)
+        self.grid = DDGrid(self.grid_rect, self.grid_width,
+                           self.grid_height, self.cell_size)
         self.info_bar = TimeInfoBar(120, global_info_bar)
         self.reset_button = Button('Reset blocks', self.info_bar.get_rect().centerx +
                                    350, self.info_bar.get_rect().centery, BLACK, WHITE, 30, self.reset_blocks)
-        self.setup_blocks()
+        self.background = pygame.Surface(self.rect.size)
+        self.background.fill(WHITE)
+        self.draw_grid(self.background)
+        self.setup_blocks(block_arrangements)
 
     def draw(self, screen: pygame.Surface):
         if not self.running:
             return self.draw_ending_screen(screen)
 
-        self.sub_surface.fill(WHITE)
-
-        self.draw_grid(self.sub_surface)
+        self.sub_surface.blit(self.background, (0, 0))
         self.draw_blocks(self.sub_surface)
 
         self.info_bar.draw(self.sub_surface)
@@ -431,7 +468,7 @@ class DefragDisk(MiniGame):
         if not DEBUG:
             self.check_time()  # Check for game over
 
-        if len(self.occupied_tiles) == 64:  # Game won
+        if self.grid.is_full():  # Game won
             self.running = False
             self.success = True
             self.ending_message = self.font.render(
@@ -454,24 +491,18 @@ class DefragDisk(MiniGame):
             if click_used:
                 continue
 
-            for block in reversed(copy(self.blocks)):  # Check in reverse draw order
-                if block.collide(x, y):
-                    # Move block to end of list
-                    self.blocks.append(self.blocks.pop(
-                        self.blocks.index(block)))
-                    block.grab()
-                    self.occupied_tiles.difference_update(
-                        block.occupied_tiles())
-                    click_used = True
-                    break
-            if click_used:
+            block = self.pick_index.get_top(x, y)
+            if block is not None:
+                self.raise_block(block)
+                block.grab()
+                self.grid.occupied &= ~block.occupied_mask()
                 continue
 
     def draw_grid(self, surface):
-        for i in range(0, 9):
+        for i in range(0, self.grid_width+1):
             pygame.draw.line(surface, BLACK, (self.grid_rect.left+i*self.cell_size,
                              self.grid_rect.top), (self.grid_rect.left+i*self.cell_size, self.grid_rect.bottom))
-        for i in range(0, 9):
+        for i in range(0, self.grid_height+1):
             pygame.draw.line(surface, BLACK, (self.grid_rect.left, self.grid_rect.top+i *
                              self.cell_size), (self.grid_rect.right, self.grid_rect.top+i*self.cell_size))
 
@@ -479,38 +510,17 @@ class DefragDisk(MiniGame):
         for block in self.blocks:
             block.draw(surface)
 
-    def setup_blocks(self):
-        """
-        1. Generate all coords
-        2. While there are still unallocated tiles:
-            - Put a random unallocated tile into a working_list
-            - Between 1 and 5 times try and change the position of one tile in working_list by one square ensuring it's in bounds and not already taken
-            - If a tile is out of bounds or already allocated, regeneration is attempted up to 20 times
-        """
-        self.blocks: list[DDBlock] = []
-        block_arrangements: list[list[tuple[int, int]]] = []
-        unallocated_coords = [(x, y) for x in range(0, 8) for y in range(0, 8)]
-        valid_coords = deepcopy(unallocated_coords)
-        while unallocated_coords:
-            working_list = [unallocated_coords.pop(
-                random.randint(0, len(unallocated_coords)-1))]
-            for i in range(random.randint(1, 5)):
-                choice = random.choice(working_list)
-                new_tile = (-1, -1)
-                attempts = 0
-                MAX_ATTEMPTS = 20
-                while ((new_tile not in valid_coords) or (new_tile not in unallocated_coords+[(-1, -1)])) and (attempts <= MAX_ATTEMPTS):
-                    attempts += 1
-                    indicie_to_change = random.randint(0, 1)
-                    delta = random.choice((-1, 1))
-                    if indicie_to_change == 0:
-                        new_tile = (choice[0]+delta, choice[1])
-                    if indicie_to_change == 1:
-                        new_tile = (choice[0], choice[1]+delta)
-                if attempts != MAX_ATTEMPTS+1:
-                    working_list.append(new_tile)
-                    unallocated_coords.remove(new_tile)
-            block_arrangements.append(working_list)
+    def raise_block(self, block: DDBlock):
+        """Moves block to the top of the draw order"""
+        del self.blocks[block]
+        self.blocks[block] = None
+        self.pick_index.raise_block(block)
+
+    def setup_blocks(self, block_arrangements=None):
+        if block_arrangements is None:
+            block_arrangements = self.generate(random.getrandbits(32))
+        self.blocks: dict[DDBlock, None] = {}  # Used as an ordered set, drawn first to last
+        self.pick_index = DDPickIndex(self.cell_size)
         if DEBUG:
             print(f'Total blocks: {len(block_arrangements)}')
 
@@ -543,28 +553,32 @@ class DefragDisk(MiniGame):
         colour_generator = cycle(
             ['blue', 'green', 'pink', 'red', 'yellow', 'purple'])
         for i in range(len(block_arrangements)):
-            self.blocks.append(DDBlock(
-                block_arrangements[i], centers[i][0], centers[i][1], next(colour_generator), self.grid_rect))
+            block = DDBlock(block_arrangements[i], centers[i][0],
+                            centers[i][1], next(colour_generator), self.grid)
+            self.blocks[block] = None
+            self.pick_index.add(block)
 
     def take_event(self, event: pygame.event.Event):
         if event.type == pygame.MOUSEMOTION:
             for block in self.blocks:
                 if block.get_grabbed():
                     block.drag(event.rel)
+                    self.pick_index.update(block)
 
         if event.type == pygame.MOUSEBUTTONUP:
             if event.button == 1:
                 for block in self.blocks:
                     if block.get_grabbed():
-                        newly_occupied_tiles = block.ungrab(
-                            self.occupied_tiles)
-                        if newly_occupied_tiles is not None:
-                            self.occupied_tiles.update(newly_occupied_tiles)
+                        newly_occupied = block.ungrab(self.grid.occupied)
+                        if newly_occupied is not None:
+                            self.grid.occupied |= newly_occupied
+                        self.pick_index.update(block)
 
     def reset_blocks(self):
-        self.occupied_tiles = set()
+        self.grid.occupied = 0
         for block in self.blocks:
             block.go_home()
+            self.pick_index.update(block)
 
 
 class OrganiseDrivers(MiniGame):
@@ -628,7 +642,15 @@ class OrganiseDrivers(MiniGame):
         else:
             return False
 
-    def __init__(self, global_info_bar):
+    @staticmethod
+    def generate(seed):
+        """Returns (node positions, connections), pure Python so MinigamePool can run it on a background thread"""
+        size_random = random.Random(seed)
+        generator = ODGraphGenerator(
+            OrganiseDrivers.check_line_intersection, size_random.getrandbits(32))
+        return generator.generate(size_random.randint(4, 7), 2, size_random.randint(*OD_TARGET_CROSSINGS))
+
+    def __init__(self, global_info_bar, graph=None):
         super().__init__(global_info_bar)
         self.intersections = []
         self.info_bar = TimeInfoBar(20, global_info_bar)
@@ -636,7 +658,7 @@ class OrganiseDrivers(MiniGame):
             'Move the circles to remove line crossings!', True, BLACK, WHITE)
         self.instruction_rect = self.instruction_text.get_rect(
             center=(MINIGAME_WIDTH/2, 100))
-        self.setup_nodes()
+        self.setup_nodes(graph)
 
     def draw(self, screen: pygame.Surface):
         if not self.running:
@@ -670,15 +692,11 @@ class OrganiseDrivers(MiniGame):
         if not self.running:
             return self.update_ending_sequence()
 
-        self.intersections = []
-        for connection_pair in combinations(self.connections, 2):
-            intersect = self.check_line_intersection(
-                self.nodes[connection_pair[0][0]].get_pos(), self.nodes[connection_pair[0][1]].get_pos(), self.nodes[connection_pair[1][0]].get_pos(), self.nodes[connection_pair[1][1]].get_pos())
-            if intersect:
-                self.intersections.append(intersect)
-
-        self.info_bar.set_custom_field_value(
-            'Line Crossings', len(self.intersections))
+        if self.crossing_table.changed:
+            self.intersections = self.crossing_table.get_points()
+            self.info_bar.set_custom_field_value(
+                'Line Crossings', len(self.intersections))
+            self.crossing_table.changed = False
 
         while self.clicks_to_handle:
             x, y = self.clicks_to_handle.pop(0)
@@ -698,104 +716,27 @@ class OrganiseDrivers(MiniGame):
             if click_used:
                 continue
 
-    @property
-    def invalid_new_connections(self):
-        return self.connections+[tuple(reversed(x)) for x in self.connections]
-
-    def setup_nodes(self):
-        self.nodes: list[ODNode] = []
-        self.connections = []
-        radius = 340
-        initial_nodes = random.randint(4, 7)
-        rel_coords = []  # List of coords relative to center of screen
-
-        for i in range(initial_nodes):  # Place nodes evenly around circle
-            rel_coords.append(
-                (radius*(cos((i*2*pi)/initial_nodes)), radius*(sin((i*2*pi)/initial_nodes))))
-
-        abs_coords = [tuple_addition(
-            (MINIGAME_WIDTH/2, MINIGAME_HEIGHT/2), coord) for coord in rel_coords]
-        for coord in abs_coords:
-            self.nodes.append(ODNode(coord))
-
-        # Connect all initial nodes
-        for connection in pairwise(range(initial_nodes)):
-            self.connections.append(connection)
-        self.connections.append((0, initial_nodes-1))
-
-        # Add connections between initial nodes
-        connections_left = random.randint(
-            min(4, initial_nodes-3), initial_nodes-3)
-        while connections_left > 0:
-            new_connection = self.connections[0]
-            while new_connection in self.invalid_new_connections or new_connection[0] == new_connection[1]:
-                new_connection = (random.randint(
-                    0, initial_nodes-1), random.randint(0, initial_nodes-1))
-            if DEBUG:
-                assert new_connection[0] != new_connection[1]
-
-            casues_intersections = False
-            for connection_pair in combinations(self.connections+[new_connection], 2):
-                intersect = self.check_line_intersection(
-                    self.nodes[connection_pair[0][0]].get_pos(), self.nodes[connection_pair[0][1]].get_pos(), self.nodes[connection_pair[1][0]].get_pos(), self.nodes[connection_pair[1][1]].get_pos())
-                if intersect:
-                    casues_intersections = True
-
-            if casues_intersections:
-                continue
-            else:
-                self.connections.append(new_connection)
-                connections_left -= 1
-
-        # Add two nodes in middle
-        self.nodes.extend([
-            ODNode(((MINIGAME_WIDTH/2)+30, (MINIGAME_HEIGHT/2)+30)),
-            ODNode(((MINIGAME_WIDTH/2)-30, (MINIGAME_HEIGHT/2)-30))
-        ])
-
-        # Try and connect extra nodes
-        for i in range(2):
-            node_index = len(self.nodes)-1-i
-            attempts_left = 10
-            while attempts_left > 0:
-                new_connection = self.connections[0]
-                while new_connection in self.invalid_new_connections or new_connection[0] == new_connection[1]:
-                    new_connection = (
-                        node_index, random.randint(0, len(self.nodes)-1))
-
-                casues_intersections = False
-                for connection_pair in combinations(self.connections+[new_connection], 2):
-                    intersect = self.check_line_intersection(
-                        self.nodes[connection_pair[0][0]].get_pos(), self.nodes[connection_pair[0][1]].get_pos(), self.nodes[connection_pair[1][0]].get_pos(), self.nodes[connection_pair[1][1]].get_pos())
-                    if intersect:
-                        casues_intersections = True
-
-                if not casues_intersections:
-                    self.connections.append(new_connection)
-                attempts_left -= 1
-
-        while self.count_intersections() == 0:
-            for node in self.nodes:
-                node.randomise_position()
+    def setup_nodes(self, graph=None):
+        if graph is None:
+            graph = self.generate(random.getrandbits(32))
+        positions, self.connections = graph
+        self.nodes: list[ODNode] = [ODNode(position) for position in positions]
 
+        self.crossing_table = ODCrossingTable(
+            self.get_node_positions(), self.connections, self.check_line_intersection)
         self.info_bar.add_custom_field(
-            'Line Crossings', self.count_intersections())
+            'Line Crossings', len(self.crossing_table))
         self.update()
 
-    def count_intersections(self):
-        num_intersections = 0
-        for connection_pair in combinations(self.connections, 2):
-            intersect = self.check_line_intersection(
-                self.nodes[connection_pair[0][0]].get_pos(), self.nodes[connection_pair[0][1]].get_pos(), self.nodes[connection_pair[1][0]].get_pos(), self.nodes[connection_pair[1][1]].get_pos())
-            if intersect:
-                num_intersections += 1
-        return num_intersections
+    def get_node_positions(self):
+        return [node.get_pos() for node in self.nodes]
 
     def take_event(self, event: pygame.event.Event):
         if event.type == pygame.MOUSEMOTION:
-            for node in self.nodes:
+            for index, node in enumerate(self.nodes):
                 if node.get_grabbed():
                     node.drag(event.rel)
+                    self.crossing_table.move_node(index, node.get_pos())
         if event.type == pygame.MOUSEBUTTONUP:
             if event.button == 1:
                 for node in self.nodes:
@@ -813,7 +754,7 @@ class UserAuthentication(MiniGame):
     def __init__(self, global_info_bar):
         super().__init__(global_info_bar)
         self.info_bar = STTInfoBar(random.randint(15, 25), 60, global_info_bar)
-        self.small_font = pygame.font.SysFont('Arial', 29)
+        self.small_font = get_font('Arial', 29)
         button_offset = 150
         button_center = (MINIGAME_WIDTH/2)-75
         self.tick = UAButton(button_center-button_offset,
@@ -826,6 +767,8 @@ class UserAuthentication(MiniGame):
         self.clipboard = Image(1000, 410, r'images/UA/clipboard.png')
         self.hashinator = Image(600, 400, r'images/UA/hashinator.png')
         self.hashinator_text = ''
+        self.blank_hashinator_text = self.small_font.render(
+            '', True, BLACK, GREY)
 
         self.instruction_text = self.small_font.render(
             'System Policy: Accounts must be locked on the third incorrect login attempt', True, BLACK, WHITE)
@@ -837,28 +780,15 @@ class UserAuthentication(MiniGame):
         self.new_request()
 
     def setup_users(self):
-        active_users = set()
-        while len(active_users) < 10:
-            active_users.add(random.choice(UA_USERNAMES))
-        self.inactive_users = list(set(UA_USERNAMES).difference(active_users))
-        active_users = list(active_users)
-        self.failed_attempts = {user: random.choice(
-            [0, 0, 0, 1, 1, 1, 2, 2]) for user in UA_USERNAMES}
-
-        active_passwords = set()
-        while len(active_passwords) < 10:
-            active_passwords.add(random.choice(UA_PASSWORDS))
-        self.inactive_passwords = list(
-            set(UA_PASSWORDS).difference(active_passwords))
-        active_passwords = list(active_passwords)
-
-        self.user_dict = {}
-        for i in range(10):
-            self.user_dict[active_users.pop(random.randint(0, len(
-                active_users)-1))] = active_passwords.pop(random.randint(0, len(active_passwords)-1))
-
-        self.hash_dict = {password: sha1(password.encode(
-            'utf-8')).hexdigest()[0:10] for password in UA_PASSWORDS}
+        # Samples come back in random order so can be paired up directly
+        active_users = random.sample(UA_USERNAMES, UA_ACTIVE_USERS)
+        self.user_dict = dict(
+            zip(active_users, random.sample(UA_PASSWORDS, UA_ACTIVE_USERS)))
+        self.inactive_users = [
+            user for user in UA_USERNAMES if user not in self.user_dict]
+        # Filled in the first time a user makes a request
+        self.failed_attempts: dict[str, int] = {}
+        self.hash_dict = UA_HASHES
 
     def new_request(self):
         self.hide_hashinator_output()
@@ -873,7 +803,8 @@ class UserAuthentication(MiniGame):
         else:
             username = random.choice(self.inactive_users)
             password = random.choice(UA_PASSWORDS)
-        failed_attempts = self.failed_attempts[username]
+        failed_attempts = self.failed_attempts.setdefault(
+            username, random.choice([0, 0, 0, 1, 1, 1, 2, 2]))
 
         if registered_user and password_correct:
             correct_response = UA_TICK
@@ -891,6 +822,8 @@ class UserAuthentication(MiniGame):
 
         self.request = UARequest(
             username, password, failed_attempts, correct_response)
+        self.hashinator_output = self.small_font.render(
+            self.hash_dict[password], True, BLACK, GREY)
 
     def tick_response(self):
         if self.request.correct_response == UA_TICK:
@@ -947,7 +880,7 @@ class UserAuthentication(MiniGame):
         users = list(self.user_dict.keys())
         passwords = list(self.user_dict.values())
         last_text_rect = self.small_font.render(
-            self.hash_dict[passwords[-1]], True, BLACK).get_rect(topleft=(left+hdelta, top+9*vdelta))
+            self.hash_dict[passwords[-1]], True, BLACK).get_rect(topleft=(left+hdelta, top+(len(passwords)-1)*vdelta))
 
         self.clipboard_text_surf = pygame.Surface(
             tuple_addition((-left, -top), (last_text_rect.right+30, last_text_rect.bottom)),  pygame.SRCALPHA, 32)
@@ -957,19 +890,17 @@ class UserAuthentication(MiniGame):
             self.clipboard_text_surf.blit(self.small_font.render(
                 self.hash_dict[passwords[i]], True, BLACK), (hdelta, i*vdelta))
 
-    @property
-    def hashinator_text_rect(self):
-        return self.rendered_hashinator_text.get_rect(topleft=(590, 450))
-
-    @property
-    def rendered_hashinator_text(self):
-        return self.small_font.render(self.hashinator_text, True, BLACK, GREY)
-
     def show_hashinator_output(self):
         self.hashinator_text = self.hash_dict[self.request.password.text]
+        self.rendered_hashinator_text = self.hashinator_output
+        self.hashinator_text_rect = self.rendered_hashinator_text.get_rect(
+            topleft=(590, 450))
 
     def hide_hashinator_output(self):
         self.hashinator_text = ''
+        self.rendered_hashinator_text = self.blank_hashinator_text
+        self.hashinator_text_rect = self.rendered_hashinator_text.get_rect(
+            topleft=(590, 450))
 
     def draw(self, screen: pygame.Surface):
         if not self.running:
@@ -1053,7 +984,7 @@ class BackupFiles(MiniGame):
 
     @property
     def phase_text(self):
-        return self.instruction_font.render(f'Current phase: {"Watch" if self.current_phase == BF_WATCH else "Copy"}', True, BLACK, WHITE)
+        return render_text(self.instruction_font, f'Current phase: {"Watch" if self.current_phase == BF_WATCH else "Copy"}', BLACK, WHITE)
 
     def setup_arrows(self):
         arrow_spacing = 220
@@ -1220,48 +1151,24 @@ class BackupFiles(MiniGame):
 
 
 class DataDecryption(MiniGame):
-    num_to_lower_alpha = {idx: letter for idx,
-                          letter in enumerate(ascii_lowercase)}
-    num_to_upper_alpha = {idx: letter for idx,
-                          letter in enumerate(ascii_uppercase)}
-
-    lower_alpha_to_num = {letter: idx for idx,
-                          letter in enumerate(ascii_lowercase)}
-    upper_alpha_to_num = {letter: idx for idx,
-                          letter in enumerate(ascii_uppercase)}
+    # str.translate tables for every shift
+    shift_tables = [str.maketrans(ascii_lowercase+ascii_uppercase,
+                                  ascii_lowercase[delta:]+ascii_lowercase[:delta] +
+                                  ascii_uppercase[delta:]+ascii_uppercase[:delta])
+                    for delta in range(26)]
 
     @classmethod
     def ceasar_shift(cls, text: str, delta: int):
-        if delta == 0:
-            return text
-        shifted_text = ''
-        for char in text:
-            if not char.isalpha():
-                shifted_text += char
-                continue
-            if char.islower():
-                old_index = cls.lower_alpha_to_num[char]
-                new_index = (old_index+delta) % 26
-                new_char = cls.num_to_lower_alpha[new_index]
-                shifted_text += new_char
-                continue
-            if char.isupper():
-                old_index = cls.upper_alpha_to_num[char]
-                new_index = (old_index+delta) % 26
-                new_char = cls.num_to_upper_alpha[new_index]
-                shifted_text += new_char
-                continue
-            raise RuntimeError(f'Character {char} not handled')
-        return shifted_text
+        return text.translate(cls.shift_tables[delta % 26])
 
     def __init__(self, global_info_bar):
         super().__init__(global_info_bar)
         self.info_bar = STTInfoBar(random.randint(7, 11), 60, global_info_bar)
-        self.phrase_font = pygame.font.SysFont('Arial', 35)
+        self.phrase_font = get_font('Arial', 35)
 
         self.ring_center = (MINIGAME_WIDTH/2, MINIGAME_HEIGHT/2+100)
-        self.outer = CSOuter(self.ring_center, r'images/cs/outer.png')
-        self.inner = Image(*self.ring_center, r'images/cs/inner.png')
+        self.outer = CSOuter(self.ring_center, r'images/CS/outer.png')
+        self.inner = Image(*self.ring_center, r'images/CS/inner.png')
         self.outer_grabbed = False
         self.initial_grab_angle = 0
         self.shift_delta = 0
@@ -1294,6 +1201,9 @@ class DataDecryption(MiniGame):
         while self.encrypted_phrase == self.correct_phrase:
             self.encrypted_phrase = DataDecryption.ceasar_shift(
                 self.correct_phrase, random.randint(0, 25))
+        # Render every shift the wheel can show now so turning it never renders text
+        self.phrase_surfaces = {(delta, BLACK): self.phrase_font.render(DataDecryption.ceasar_shift(
+            self.encrypted_phrase, delta), True, BLACK, WHITE) for delta in range(26)}
         self.render_phrase()
 
     def change_range(self, angle):
@@ -1320,8 +1230,11 @@ class DataDecryption(MiniGame):
             self.render_phrase()
 
     def render_phrase(self):
-        self.rendered_phrase = self.phrase_font.render(DataDecryption.ceasar_shift(
-            self.encrypted_phrase, self.shift_delta), True, self.phrase_colour, WHITE)
+        key = (self.shift_delta % 26, self.phrase_colour)
+        if key not in self.phrase_surfaces:
+            self.phrase_surfaces[key] = self.phrase_font.render(DataDecryption.ceasar_shift(
+                self.encrypted_phrase, self.shift_delta), True, self.phrase_colour, WHITE)
+        self.rendered_phrase = self.phrase_surfaces[key]
         self.phrase_rect = self.rendered_phrase.get_rect(
             center=(MINIGAME_WIDTH/2, 150))
 
@@ -1377,16 +1290,17 @@ class DataCompression(MiniGame):
     def grid_coords_to_pixel_top_left(coords):
         return tuple_addition(DC_GRID_TOP_LEFT, (50*coords[0]+1, 50*coords[1]+1))
 
-    def __init__(self, global_info_bar):
+    def __init__(self, global_info_bar, width=DC_GRID_WIDTH, height=DC_GRID_HEIGHT):
         super().__init__(global_info_bar)
         self.num_rows_cleared = 0
         self.row_clear_target = random.randint(4, 6)
         self.info_bar = TimeInfoBar(500, global_info_bar)
         self.info_bar.add_custom_field(
             'Rows to clear', self.rows_to_clear)
+        # Only the default size fits on screen, other sizes are for DCAutoPlayer benchmarks
+        self.board = DCBoard(width, height)
         self.setup_images()
-        # Grid Coord -> colour
-        self.blocked_slots = {(i, 13): None for i in range(11)}
+        self.setup_grid_overlay()
         self.new_block()
 
     @property
@@ -1395,8 +1309,8 @@ class DataCompression(MiniGame):
 
     def setup_images(self):
         self.colours = ['blue', 'green', 'pink', 'purple', 'red', 'yellow']
-        self.surfaces = {colour: pygame.image.load(
-            f'images/DC/{colour}.png').convert_alpha() for colour in self.colours}
+        self.surfaces = {colour: get_image(
+            f'images/DC/{colour}.png') for colour in self.colours}
         self.colours = cycle(self.colours)
 
     def draw(self, screen: pygame.Surface):
@@ -1405,7 +1319,7 @@ class DataCompression(MiniGame):
         self.sub_surface.fill(WHITE)
         self.block.draw(self.sub_surface)
         self.draw_blocked_slots()
-        self.draw_grid()
+        self.sub_surface.blit(self.grid_overlay, self.grid_overlay_pos)
 
         self.info_bar.draw(self.sub_surface)
         self.common_drawing(screen)
@@ -1417,11 +1331,10 @@ class DataCompression(MiniGame):
             self.check_time()
 
         if self.block.get_solid():
-            colour = self.block.get_colour()
-            for coord in self.block.get_grid_coords():
-                self.blocked_slots[coord] = colour
+            self.board.place(self.block.get_grid_coords(),
+                             self.block.get_colour())
             self.new_block()
-        self.block.update(self.blocked_slots)
+        self.block.update(self.board)
 
         while self.clicks_to_handle:
             x, y = self.clicks_to_handle.pop(0)
@@ -1432,20 +1345,27 @@ class DataCompression(MiniGame):
             if click_used:
                 continue
 
-    def draw_grid(self):
+    def setup_grid_overlay(self):
+        """Grid is drawn over the blocks, so is kept on a transparent surface just big enough to hold it"""
+        # Whole pixel offset so lines rasterise exactly as if drawn straight onto sub_surface
+        self.grid_overlay_pos = (int(DC_GRID_TOP_LEFT[0])-2, int(DC_GRID_TOP_LEFT[1])-2)
+        self.grid_overlay = pygame.Surface(
+            (50*self.board.width+5, MINIGAME_HEIGHT-self.grid_overlay_pos[1]+1), pygame.SRCALPHA)
+        self.draw_grid(self.grid_overlay, tuple_addition(
+            DC_GRID_TOP_LEFT, (-self.grid_overlay_pos[0], -self.grid_overlay_pos[1])))
+
+    def draw_grid(self, surface, top_left):
         # Vertical
-        for i in range(12):
-            pygame.draw.line(self.sub_surface, GREY, tuple_addition(DC_GRID_TOP_LEFT, (
-                i*50, 0)), tuple_addition(DC_GRID_TOP_LEFT, (i*50, MINIGAME_HEIGHT)), 2)
+        for i in range(self.board.width+1):
+            pygame.draw.line(surface, GREY, tuple_addition(top_left, (
+                i*50, 0)), tuple_addition(top_left, (i*50, MINIGAME_HEIGHT)), 2)
         # Horizontal
-        for i in range(14):
-            pygame.draw.line(self.sub_surface, GREY, tuple_addition(DC_GRID_TOP_LEFT, (
-                0, i*50)), tuple_addition(DC_GRID_TOP_LEFT, (50*11, i*50)), 2)
+        for i in range(self.board.height+1):
+            pygame.draw.line(surface, GREY, tuple_addition(top_left, (
+                0, i*50)), tuple_addition(top_left, (50*self.board.width, i*50)), 2)
 
     def draw_blocked_slots(self):
-        for coord, colour in self.blocked_slots.items():
-            if colour is None:
-                continue
+        for coord, colour in self.board.get_filled_slots():
             pixel_coords = DataCompression.grid_coords_to_pixel_top_left(coord)
             self.sub_surface.blit(self.surfaces[colour], pixel_coords)
 
@@ -1462,8 +1382,8 @@ class DataCompression(MiniGame):
             'Rows to clear', self.rows_to_clear)
         new_colour = next(self.colours)
         self.block = DCBlock(
-            self.surfaces[new_colour], new_colour, self.global_info_bar)
-        successful_spawn = self.block.get_spawn_success(self.blocked_slots)
+            self.surfaces[new_colour], new_colour, self.global_info_bar, self.board.width)
+        successful_spawn = self.block.get_spawn_success(self.board)
         if not successful_spawn:
             self.running = False
             self.success = False
@@ -1473,34 +1393,17 @@ class DataCompression(MiniGame):
                 center=self.sub_rect.center)
 
     def check_completed_rows(self):
-        cleared_rows = []
-        for row_number in range(13):
-            taken_slots_in_row = [
-                coord for coord in self.blocked_slots if coord[1] == row_number]
-            if len(taken_slots_in_row) == 11:
-                cleared_rows.append(row_number)
-
-        self.num_rows_cleared += len(cleared_rows)
-        for row_number in cleared_rows:
-            for item in sorted(self.blocked_slots.items(), key=lambda x: x[0][1], reverse=True):
-                coord, colour = item
-                if coord[1] == row_number:
-                    self.blocked_slots.pop(coord)
-                if coord[1] < row_number:
-                    self.blocked_slots.pop(coord)
-                    new_coord = tuple_addition(coord, (0, 1))
-                    assert new_coord not in self.blocked_slots
-                    self.blocked_slots[new_coord] = colour
+        self.num_rows_cleared += self.board.clear_full_rows()
 
     def take_event(self, event):
         if event.type == pygame.KEYDOWN:
             if event.key == pygame.K_e:
-                self.block.rotate('clockwise', self.blocked_slots)
+                self.block.rotate('clockwise', self.board)
             elif event.key == pygame.K_q:
-                self.block.rotate('anticlockwise', self.blocked_slots)
+                self.block.rotate('anticlockwise', self.board)
             elif event.key == pygame.K_a:
-                self.block.move('left', self.blocked_slots)
+                self.block.move('left', self.board)
             elif event.key == pygame.K_d:
-                self.block.move('right', self.blocked_slots)
+                self.block.move('right', self.board)
             elif event.key == pygame.K_s:
-                self.block.attempt_fall(self.blocked_slots, True)
+                self.block.attempt_fall(self.board, True)
@@ -0,0 +1,125 @@
+import csv
+import json
+import time
+from collections import deque
+import pygame
+from constants import *
+from utils import get_font
+
+
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0
+    index = min(len(sorted_samples)-1, round(fraction*(len(sorted_samples)-1)))
+    return sorted_samples[index]
+
+
+class FrameProfiler:
+    """Times the update() and draw() of each panel every frame.
+
+    Keeps a rolling window of samples for p50/p95/p99 values and a per-frame trace of the last trace_length frames
+    that can be dumped to csv or json"""
+    HUD_REFRESH_FRAMES = 30
+
+    def __init__(self, window=300, show_hud=False, trace_length=FPS*60*10):
+        self.window = window
+        self.show_hud = show_hud
+        self.samples: dict[str, deque[float]] = {}
+        self.trace: deque[dict[str, float]] = deque(maxlen=trace_length)
+        self.frames_traced = 0
+        self.current_frame: dict[str, float] = {}
+        self.frame_start = None
+        self.font = None
+        self.hud_surface = None
+        self.hud_draws = 0
+        self.hud_rect = pygame.Rect(10, 10, 0, 0)
+
+    def start_frame(self):
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self.record('frame', now-self.frame_start)
+            self.end_frame()
+        self.frame_start = now
+
+    def end_frame(self):
+        self.trace.append(self.current_frame)
+        self.frames_traced += 1
+        self.current_frame = {}
+
+    def record(self, name, seconds):
+        ms = seconds*1000
+        self.current_frame[name] = self.current_frame.get(name, 0) + ms
+        if name not in self.samples:
+            self.samples[name] = deque(maxlen=self.window)
+        self.samples[name].append(ms)
+
+    def time(self, name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.record(name, time.perf_counter()-start)
+        return result
+
+    def time_panel(self, panel, method_name, *args):
+        return self.time(f'{type(panel).__name__}.{method_name}', getattr(panel, method_name), *args)
+
+    def get_percentiles(self, name):
+        """Returns (p50, p95, p99) in ms over the rolling window"""
+        samples = sorted(self.samples.get(name, ()))
+        return percentile(samples, 0.5), percentile(samples, 0.95), percentile(samples, 0.99)
+
+    def get_summary(self):
+        return {name: dict(zip(('p50', 'p95', 'p99'), self.get_percentiles(name)))
+                for name in self.samples}
+
+    def toggle_hud(self):
+        self.show_hud = not self.show_hud
+
+    def draw_hud(self, screen: pygame.Surface):
+        """Returns rect drawn over, or None if the HUD is hidden"""
+        if not self.show_hud:
+            return None
+        if self.hud_draws % FrameProfiler.HUD_REFRESH_FRAMES == 0:
+            self.render_hud()
+        self.hud_draws += 1
+        screen.blit(self.hud_surface, self.hud_rect)
+        return self.hud_rect
+
+    def render_hud(self):
+        if self.font is None:
+            self.font = get_font('Consolas', 16)
+        lines = [f'{"ms":<32}{"p50":>7}{"p95":>7}{"p99":>7}']
+        summary = sorted(self.get_summary().items(),
+                         key=lambda x: x[1]['p99'], reverse=True)
+        for name, values in summary:
+            lines.append(
+                f'{name:<32}{values["p50"]:>7.2f}{values["p95"]:>7.2f}{values["p99"]:>7.2f}')
+        rendered_lines = [self.font.render(line, True, WHITE, BLACK)
+                          for line in lines]
+        width = max(line.get_width() for line in rendered_lines)
+        line_height = self.font.get_linesize()
+        self.hud_surface = pygame.Surface(
+            (width+10, line_height*len(rendered_lines)+10))
+        self.hud_surface.fill(BLACK)
+        for i, line in enumerate(rendered_lines):
+            self.hud_surface.blit(line, (5, 5+i*line_height))
+        self.hud_rect.size = self.hud_surface.get_size()
+
+    def dump(self, path):
+        """Writes the per-frame trace, as json if path ends in .json otherwise csv"""
+        if path.endswith('.json'):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'summary': self.get_summary(),
+                           'first_frame_number': self.frames_traced-len(self.trace),
+                           'frames': list(self.trace)}, f)
+            return
+
+        columns = {}  # Used as an ordered set
+        for frame in self.trace:
+            columns.update(dict.fromkeys(frame))
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame_number']+list(columns))
+            # Older frames have been dropped from the trace
+            for i, frame in enumerate(self.trace, self.frames_traced-len(self.trace)):
+                writer.writerow(
+                    [i]+[round(frame[name], 4) if name in frame else '' for name in columns])
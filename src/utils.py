@@ -1,19 +1,333 @@
 import time
+import os
 from constants import *
 import pygame
 import random
-from math import radians, sin, sqrt, degrees, pi
+from math import radians, sin, cos, sqrt, degrees, pi, ceil
+from itertools import pairwise, combinations
 from statistics import median
 import requests
 import json
+import threading
 from datetime import date, timedelta
+from collections import OrderedDict
+try:
+    import numpy as np
+except ImportError:  # Crossing checks fall back to testing one pair at a time
+    np = None
+
+
+class TextCache:
+    """Size bounded LRU cache of rendered text, so text is only rasterised when it changes"""
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self.surfaces: OrderedDict[tuple, pygame.Surface] = OrderedDict()
+
+    def render(self, font: pygame.font.Font, text, colour, background=None, antialias=True):
+        key = (font, text, antialias, colour, background)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = font.render(text, antialias, colour, background)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+
+class RotationCache:
+    """Rotated copies of an image, every angle is rounded to the nearest step. Steps on exact_angles are rendered
+    up front and cropped to their visible pixels, the rest are kept uncropped in a size bounded LRU cache"""
+
+    def __init__(self, image: pygame.Surface, exact_angles, step, max_size):
+        self.image = image
+        self.step = step
+        self.steps_per_turn = round(2*pi/step)
+        self.max_size = max_size
+        self.exact_sprites = {self.get_steps(angle): self.rotate_cropped(angle) for angle in exact_angles}
+        self.sprites: OrderedDict[int, tuple] = OrderedDict()
+
+    def get_steps(self, angle):
+        return round(angle/self.step) % self.steps_per_turn
+
+    def rotate(self, angle):
+        """Returns (sprite, size of the uncropped rotated image, top left of sprite within it)"""
+        rotated = pygame.transform.rotate(self.image, -degrees(angle))
+        return rotated, rotated.get_size(), (0, 0)
+
+    def rotate_cropped(self, angle):
+        rotated = pygame.transform.rotate(self.image, -degrees(angle))
+        bounds = rotated.get_bounding_rect()
+        return rotated.subsurface(bounds).copy(), rotated.get_size(), bounds.topleft
+
+    def get(self, angle):
+        """angle is clockwise in radians"""
+        steps = self.get_steps(angle)
+        sprite = self.exact_sprites.get(steps)
+        if sprite is not None:
+            return sprite
+
+        sprite = self.sprites.get(steps)
+        if sprite is not None:
+            self.sprites.move_to_end(steps)
+            return sprite
+
+        sprite = self.rotate(steps*self.step)
+        self.sprites[steps] = sprite
+        if len(self.sprites) > self.max_size:
+            self.sprites.popitem(last=False)
+        return sprite
+
+
+class ScoreUploader:
+    """Uploads scores on a background thread, retrying network and server errors with backoff.
+    Scores the server rejects are dropped so they can't hold up the rest of the queue.
+
+    Waiting scores are kept in a journal file so they survive the game closing or crashing, and are sent on the next launch"""
+
+    def __init__(self, url=SERVER_URL+'new.php', journal_path=SCORE_JOURNAL_PATH):
+        self.url = url
+        self.journal_path = journal_path
+        self.lock = threading.Lock()  # Guards pending and the journal file
+        self.wake = threading.Event()
+        self.random = random.Random()  # Keeps the game's random sequence the same whatever the network does
+        self.pending: list[dict] = self.load_journal()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, payload: dict):
+        with self.lock:
+            self.pending.append(payload)
+            self.save_journal()
+        self.wake.set()
+
+    def load_journal(self):
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            print(f'Score journal could not be read, {e}')
+            return []
+
+    def save_journal(self):
+        # Written to a temporary file first so a crash mid-write can't corrupt the journal
+        temporary_path = self.journal_path+'.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(self.pending, f)
+        os.replace(temporary_path, self.journal_path)
+
+    def run(self):
+        retry_delay = UPLOAD_RETRY_DELAYS[0]
+        server_errors = 0  # For the score at the front of the queue
+        while True:
+            with self.lock:
+                payload = self.pending[0] if self.pending else None
+            if payload is None:
+                self.wake.wait()
+                self.wake.clear()
+                continue
+
+            result = self.upload(payload)
+            if result == 'server error':
+                server_errors += 1
+                if server_errors >= UPLOAD_MAX_SERVER_ERRORS:
+                    print(f'Score dropped after {server_errors} server errors, {payload}')
+                    result = 'rejected'
+            if result in ('sent', 'rejected'):
+                with self.lock:
+                    self.pending.remove(payload)
+                    self.save_journal()
+                retry_delay = UPLOAD_RETRY_DELAYS[0]
+                server_errors = 0
+            else:
+                # A new score being submitted retries straight away
+                self.wake.wait(retry_delay*self.random.uniform(0.8, 1.2))
+                self.wake.clear()
+                retry_delay = min(2*retry_delay, UPLOAD_RETRY_DELAYS[1])
+
+    def upload(self, payload):
+        """Returns 'sent', 'network error', 'server error' (5xx) or 'rejected' (any other failure)"""
+        try:
+            r = requests.post(self.url, data=payload, timeout=UPLOAD_TIMEOUT)
+        except requests.RequestException as e:
+            print(f'Score upload failed, {e}, {SCHOOL_MODE=}')
+            return 'network error'
+        if r.status_code == 200:
+            return 'sent'
+        if r.status_code >= 500:
+            print(
+                f'Score upload failed with code {r.status_code}, {SCHOOL_MODE=}')
+            return 'server error'
+        # Sending the same score again won't change the answer
+        print(f'Score rejected with code {r.status_code}, dropping {payload}, {SCHOOL_MODE=}')
+        return 'rejected'
+
+
+text_cache = TextCache()
+# image name -> shared cache of its rotations
+rotation_caches: dict[str, RotationCache] = {}
+# (face, size, bold, italic) -> shared font object
+fonts: dict[tuple[str, int, bool, bool], pygame.font.Font] = {}
+
+
+def get_font(face, size, bold=False, italic=False):
+    """Returns a shared font, only looking up the system font the first time it's asked for"""
+    key = (face, size, bold, italic)
+    font = fonts.get(key)
+    if font is None:
+        font = pygame.font.SysFont(face, size, bold, italic)
+        fonts[key] = font
+    return font
+
+
+def prewarm_fonts():
+    for face, size in PREWARMED_FONTS:
+        get_font(face, size)
+
+
+# normalised path -> converted surface
+images: dict[str, pygame.Surface] = {}
+
+
+def normalise_image_path(image_name):
+    return os.path.normpath(image_name.replace('\\', '/')).replace('\\', '/')
+
+
+def get_rotation_cache(image_name):
+    """Returns the shared rotations of a cipher wheel image, rendering the snap positions the first time"""
+    key = normalise_image_path(image_name)
+    cache = rotation_caches.get(key)
+    if cache is None:
+        cache = RotationCache(get_image(key), CS_ANGLES[:-1],
+                              CS_ROTATION_STEP, CS_ROTATION_CACHE_SIZE)
+        rotation_caches[key] = cache
+    return cache
+
+
+def get_image(image_name):
+    """Returns a shared converted surface, only loading it from disk the first time. Don't draw onto it"""
+    key = normalise_image_path(image_name)
+    image = images.get(key)
+    if image is None:
+        image = pygame.image.load(key).convert_alpha()
+        images[key] = image
+    return image
+
+
+def preload_images(directory='images'):
+    """Loads every image the game uses so nothing is read from disk mid-frame"""
+    for root, dirs, files in os.walk(directory):
+        # big/ holds the full size source artwork, which the game never draws
+        dirs[:] = [name for name in dirs if name != 'big']
+        for file in files:
+            if file.endswith(('.png', '.jpg')):
+                get_image(os.path.join(root, file))
+
+
+def render_text(font: pygame.font.Font, text, colour, background=None):
+    """Returns a shared surface from text_cache, don't draw onto it"""
+    return text_cache.render(font, text, colour, background)
+
+
+class DirtyRectRenderer:
+    """Redraws only the panels whose draw state has changed and pushes just their rects to the display.
+
+    Panels implement get_draw_state(), returning a value that changes whenever what they draw does, or None to be redrawn every frame"""
+
+    def __init__(self, screen: pygame.Surface, background=WHITE):
+        self.screen = screen
+        self.background = background
+        self.panels = None
+        self.overlapping_panels = set()
+        self.draw_states = {}
+        self.full_redraw = True
+
+    def force_full_redraw(self):
+        self.full_redraw = True
+
+    def set_panels(self, panels):
+        self.panels = list(panels)
+        # A panel that overlaps another can't be redrawn on its own without erasing its neighbour
+        self.overlapping_panels = set()
+        for i, panel in enumerate(self.panels):
+            for other in self.panels[i+1:]:
+                if panel.rect.colliderect(other.rect):
+                    self.overlapping_panels.update((panel, other))
+        self.full_redraw = True
+
+    def render(self, panels, draw_panel=None, draw_static=None, draw_overlay=None):
+        """draw_static draws anything outside the panels that only changes on full redraws,
+        draw_overlay is drawn every frame on top and returns the rect it covered"""
+        if draw_panel is None:
+            def draw_panel(panel): return panel.draw(self.screen)
+        if panels != self.panels:
+            self.set_panels(panels)
+
+        states = {panel: panel.get_draw_state() for panel in panels}
+        dirty_panels = [panel for panel in panels
+                        if panel not in self.draw_states or states[panel] is None or states[panel] != self.draw_states[panel]]
+        if not self.overlapping_panels.isdisjoint(dirty_panels):
+            self.full_redraw = True
+
+        if self.full_redraw:
+            self.screen.fill(self.background)
+            if draw_static is not None:
+                draw_static()
+            for panel in panels:
+                draw_panel(panel)
+            dirty_rects = [self.screen.get_rect()]
+            self.full_redraw = False
+        else:
+            dirty_rects = []
+            for panel in dirty_panels:
+                self.screen.fill(self.background, panel.rect)
+                draw_panel(panel)
+                dirty_rects.append(panel.rect)
+        self.draw_states = states
+
+        if draw_overlay is not None:
+            overlay_rect = draw_overlay()
+            if overlay_rect is not None:
+                dirty_rects.append(overlay_rect)
+        pygame.display.update(dirty_rects)
+
+
+class FixedTimestep:
+    """Turns variable frame times into a whole number of fixed length simulation steps.
+
+    alpha is how far the frame lies between the last two steps, used to interpolate drawing"""
+
+    def __init__(self, step=SIMULATION_STEP, max_steps=MAX_STEPS_PER_FRAME):
+        self.step = step
+        self.max_steps = max_steps
+        self.accumulator = 0
+        self.alpha = 1
+
+    def advance(self, frame_time):
+        """Returns the number of steps to run for a frame that took frame_time seconds"""
+        self.accumulator += frame_time
+        # Tolerance stops a frame time of exactly one step rounding down to zero steps
+        steps = int((self.accumulator+1e-9)//self.step)
+        if steps > self.max_steps:
+            # Too slow to catch up, so the game slows down instead of spiralling further behind
+            steps = self.max_steps
+            self.accumulator = 0
+        else:
+            self.accumulator = max(0, self.accumulator-steps*self.step)
+        self.alpha = min(1, self.accumulator/self.step)
+        return steps
 
 
 class Button:
     def __init__(self, text, center_x, center_y, border_colour, background_colour, font_size, action):
-        self.font = pygame.font.SysFont('Arial', font_size)
+        self.font = get_font('Arial', font_size)
         self.text = text
-        self.rendered_text = self.font.render(self.text, True, BLACK)
+        self.rendered_text = render_text(self.font, self.text, BLACK)
         if self.text == 'All':
             self.rect = pygame.Rect(
                 0, 0, self.rendered_text.get_width()*1.3, self.rendered_text.get_height()*1.2)
@@ -42,6 +356,9 @@ class Button:
     def get_rect(self):
         return self.rect
 
+    def get_draw_state(self):
+        return ()
+
 
 class ToggleButton(Button):
     def __init__(self, text, center_x, center_y, border_colour, background_colour, active_background_colour, font_size, active, action=None):
@@ -68,10 +385,13 @@ class ToggleButton(Button):
         pygame.draw.rect(screen, self.border_colour, self.rect, 2)
         screen.blit(self.rendered_text, self.text_rect)
 
+    def get_draw_state(self):
+        return self.active
+
 
 class Image:
     def __init__(self, center_x, center_y, image_name, scale=1):
-        self.image = pygame.image.load(image_name).convert_alpha()
+        self.image = get_image(image_name)
         if scale != 1:
             self.image = pygame.transform.smoothscale(
                 self.image, (scale*self.image.get_width(), scale*self.image.get_height()))
@@ -86,6 +406,9 @@ class Image:
     def click(self, *args, **kwargs):
         pass
 
+    def get_draw_state(self):
+        return ()
+
 
 class STTInfoBar:  # Score, target, time, info bar
     def __init__(self, target, time_allowed, global_info_bar):
@@ -96,7 +419,7 @@ class STTInfoBar:  # Score, target, time, info bar
         self.start_timestamp = self.global_info_bar.get_time_elapsed()
         self.rect = pygame.Rect(
             10, 10, MINIGAME_WIDTH*0.8, MINIGAME_HEIGHT*0.08)
-        self.font = pygame.font.SysFont("Arial", 30)
+        self.font = get_font('Arial', 30)
 
         score_text = self.font.render(
             f'Score: {self.score}', True,  BLACK, GREY)
@@ -130,12 +453,11 @@ class STTInfoBar:  # Score, target, time, info bar
         pygame.draw.rect(screen, GREY, self.rect)
         pygame.draw.rect(screen, BLACK, self.rect, 3, 2)
 
-        score_text = self.font.render(
-            f'Score: {self.score}', True,  BLACK, GREY)
-        target_text = self.font.render(
-            f'Target: {self.target}', True, BLACK, GREY)
-        time_text = self.font.render(
-            f'Time Remaining: {self.time_left}', True, BLACK, GREY)
+        score_text = render_text(self.font, f'Score: {self.score}', BLACK, GREY)
+        target_text = render_text(
+            self.font, f'Target: {self.target}', BLACK, GREY)
+        time_text = render_text(
+            self.font, f'Time Remaining: {self.time_left}', BLACK, GREY)
 
         screen.blit(score_text, self.score_rect)
         screen.blit(target_text, self.target_rect)
@@ -158,7 +480,7 @@ class TimeInfoBar:
         self.start_timestamp = self.global_info_bar.get_time_elapsed()
         self.rect = pygame.Rect(
             10, 10, MINIGAME_WIDTH*0.8, MINIGAME_HEIGHT*0.08)
-        self.font = pygame.font.SysFont("Arial", 30)
+        self.font = get_font('Arial', 30)
 
         time_text = self.font.render(
             f'Time Remaining: {self.time_left}', True, BLACK, GREY)
@@ -176,8 +498,8 @@ class TimeInfoBar:
         pygame.draw.rect(screen, GREY, self.rect)
         pygame.draw.rect(screen, BLACK, self.rect, 3, 2)
 
-        time_text = self.font.render(
-            f'Time Remaining: {self.time_left}', True, BLACK, GREY)
+        time_text = render_text(
+            self.font, f'Time Remaining: {self.time_left}', BLACK, GREY)
         screen.blit(time_text, self.time_rect)
 
         self.update_custom_field_text()
@@ -198,8 +520,8 @@ class TimeInfoBar:
         for field in self.custom_fields.items():
             key = field[0]
             value = field[1]
-            value = (value[0], value[1], self.font.render(
-                f'{key}: {value[0]}', True, BLACK, GREY))
+            value = (value[0], value[1], render_text(
+                self.font, f'{key}: {value[0]}', BLACK, GREY))
             self.custom_fields[key] = value
 
     def draw_custom_fields(self, screen: pygame.Surface):
@@ -232,11 +554,10 @@ class RMIButton:
         self.screen_rect = screen_rect
         self.scam = (random.randint(1, 100) <= scam_chance)
         if self.scam:
-            image_name = 'images\RMI\scam' + str(random.randint(1, 3)) + '.png'
+            image_name = f'images/RMI/scam{random.randint(1, 3)}.png'
         else:
-            image_name = 'images\RMI\\' + \
-                random.choice(RMIButton.IMAGE_NAMES) + '.png'
-        self.image = pygame.image.load(image_name).convert_alpha()
+            image_name = f'images/RMI/{random.choice(RMIButton.IMAGE_NAMES)}.png'
+        self.image = get_image(image_name)
         self.speed = random.uniform(1.8, 3.7)
 
         # Pick random point on perimiter and push offscreen
@@ -258,6 +579,7 @@ class RMIButton:
                 (position-2*self.screen_rect.width-self.screen_rect.height)
 
         self.x, self.y = center_x, center_y
+        self.previous_x, self.previous_y = self.x, self.y
         self.rect = self.image.get_rect(center=(self.x, self.y))
         self.target_coords = (random.randint(round(self.screen_rect.width*0.1), round(self.screen_rect.width*0.9)),
                               random.randint(round(self.screen_rect.height*0.1), round(self.screen_rect.height*0.9)))
@@ -269,20 +591,24 @@ class RMIButton:
         self.has_been_on_screen = False
         self.delete_button = delete_button
 
-    def draw(self, screen: pygame.Surface):
+    def draw(self, screen: pygame.Surface, alpha=1):
+        draw_rect = self.rect.copy()
+        draw_rect.center = (lerp(self.previous_x, self.x, alpha),
+                            lerp(self.previous_y, self.y, alpha))
         if self.scam and DEBUG:
             pygame.draw.rect(screen, RED,
-                             self.rect.inflate(20, 20))
+                             draw_rect.inflate(20, 20))
         if DEBUG:
             pygame.draw.aaline(
-                screen, BLUE, self.rect.center, self.target_coords)
-        screen.blit(self.image, self.rect)
+                screen, BLUE, draw_rect.center, self.target_coords)
+        screen.blit(self.image, draw_rect)
 
     def click(self):
         # Action is a function in RMI class that accepts ID of an RMIButton and deals with its click
         self.action(self.ID)
 
-    def update(self):
+    def fixed_update(self):
+        self.previous_x, self.previous_y = self.x, self.y
         self.x += self.velocity.x
         self.y += self.velocity.y
         self.rect.center = (self.x, self.y)
@@ -300,11 +626,9 @@ class RMIButton:
 class MMBin:
     def __init__(self, center_x, center_y, score):
         self.score = score
-        self.back_image = pygame.image.load(
-            r'images\MM\full_bin.png').convert_alpha()
-        self.front_image = pygame.image.load(
-            r'images\MM\front_bin.png').convert_alpha()
-        self.font = pygame.font.SysFont('Arial', 20)
+        self.back_image = get_image(r'images\MM\full_bin.png')
+        self.front_image = get_image(r'images\MM\front_bin.png')
+        self.font = get_font('Arial', 20)
         self.score_text = self.font.render(str(self.score), True, WHITE)
         self.rect = self.back_image.get_rect(center=(center_x, center_y))
         self.back_wall_edge = self.rect.right-14
@@ -332,11 +656,11 @@ class MMGarbage:
     HOME_POS = (240, MINIGAME_HEIGHT*0.41)
 
     def __init__(self, delete_garbage, walls):
-        self.image = pygame.image.load(
-            r'images\MM\garbage.png').convert_alpha()
+        self.image = get_image(r'images\MM\garbage.png')
 
         self.velocity = pygame.math.Vector2()
         self.pos = pygame.math.Vector2(MMGarbage.HOME_POS)
+        self.previous_pos = self.pos.copy()
         self.update_rect()
         self.walls: list[MMWall] = walls
         self.delete_garbage = delete_garbage
@@ -348,16 +672,19 @@ class MMGarbage:
     def update_rect(self):
         self.rect = self.image.get_rect(center=self.pos)
 
-    def draw(self, screen: pygame.Surface):
+    def draw(self, screen: pygame.Surface, alpha=1):
+        draw_rect = self.image.get_rect(
+            center=self.previous_pos.lerp(self.pos, alpha))
         if not self.freefall:
-            pygame.draw.line(screen, BLACK, (self.rect.right-10, self.rect.centery),
+            pygame.draw.line(screen, BLACK, (draw_rect.right-10, draw_rect.centery),
                              (250, MINIGAME_HEIGHT*0.405), 5)
-        screen.blit(self.image, self.rect)
+        screen.blit(self.image, draw_rect)
         if not self.freefall:
-            pygame.draw.line(screen, BLACK, (self.rect.left+2, self.rect.centery),
+            pygame.draw.line(screen, BLACK, (draw_rect.left+2, draw_rect.centery),
                              (230, MINIGAME_HEIGHT*0.395), 5)
 
-    def update(self):
+    def fixed_update(self):
+        self.previous_pos = self.pos.copy()
         if self.freefall:
             self.velocity.y += MM_GRAVITY
             self.pos.x += self.velocity.x
@@ -385,11 +712,12 @@ class MMGarbage:
             MMGarbage.HOME_POS) - mouse_vector
         if displacement_from_home.magnitude() < 170:
             self.pos = mouse_vector
-            self.update_rect()
         else:
             self.pos = pygame.math.Vector2(
                 MMGarbage.HOME_POS) + displacement_from_home.normalize()*-170
-            self.update_rect()
+        # Dragging follows the mouse so isn't interpolated
+        self.previous_pos = self.pos.copy()
+        self.update_rect()
 
     def throw(self):
         """Returns if garbage was actually thrown"""
@@ -402,6 +730,7 @@ class MMGarbage:
             return True
         else:
             self.pos = pygame.math.Vector2(MMGarbage.HOME_POS)
+            self.previous_pos = self.pos.copy()
             return False
 
     def get_rect(self):
@@ -419,12 +748,16 @@ class MMWall:
         self.rect = pygame.Rect(left, 0, 10, random.randint(70, 100))
         self.time = random.randint(0, 359)
         self.speed = random.uniform(0.3, 2)
-        self.update()
+        self.fixed_update()
+        self.previous_top = self.rect.top
 
-    def draw(self, screen):
-        pygame.draw.rect(screen, BLACK, self.rect)
+    def draw(self, screen, alpha=1):
+        draw_rect = self.rect.copy()
+        draw_rect.top = lerp(self.previous_top, self.rect.top, alpha)
+        pygame.draw.rect(screen, BLACK, draw_rect)
 
-    def update(self):
+    def fixed_update(self):
+        self.previous_top = self.rect.top
         self.rect.top = 0.4*MINIGAME_HEIGHT + \
             sin(self.speed*radians(self.time))*200
         self.time += 1
@@ -432,13 +765,150 @@ class MMWall:
             self.time = 0
 
 
+def partition_grid(width, height, min_size=1, max_size=6, seed=None):
+    """Splits a width x height grid into random polyominoes of up to max_size tiles, returns lists of coords.
+
+    Free tiles are bits of an integer (bit y*width+x) and each block grows from a set of free neighbours,
+    so every tile is handled a fixed number of times. Blocks under min_size are merged into a neighbour
+    if one has room"""
+    rng = random.Random(seed)
+    tile_count = width*height
+    neighbours = []
+    for tile in range(tile_count):
+        x, y = tile % width, tile//width
+        neighbours.append([tile+dx+dy*width for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1))
+                           if 0 <= x+dx < width and 0 <= y+dy < height])
+
+    free = (1 << tile_count)-1
+    owners = [0]*tile_count  # Tile -> index of block it belongs to
+    blocks: list[list[int]] = []
+    start_order = list(range(tile_count))
+    rng.shuffle(start_order)
+    for start in start_order:
+        if not free >> start & 1:
+            continue
+        free &= ~(1 << start)
+        block = [start]
+        owners[start] = len(blocks)
+        frontier = {tile for tile in neighbours[start] if free >> tile & 1}
+        target_size = rng.randint(min(2, max_size), max_size)
+        while len(block) < target_size and frontier:
+            tile = rng.choice(sorted(frontier))
+            frontier.discard(tile)
+            free &= ~(1 << tile)
+            block.append(tile)
+            owners[tile] = len(blocks)
+            frontier.update(
+                neighbour for neighbour in neighbours[tile] if free >> neighbour & 1)
+        blocks.append(block)
+
+    # A tile boxed in by finished blocks can end up on its own
+    for index, block in enumerate(blocks):
+        if not block or len(block) >= min_size:
+            continue
+        for neighbour in sorted({owners[n] for tile in block for n in neighbours[tile]} - {index}):
+            if len(blocks[neighbour])+len(block) <= max_size:
+                for tile in block:
+                    owners[tile] = neighbour
+                blocks[neighbour].extend(block)
+                blocks[index] = []
+                break
+
+    return [[(tile % width, tile//width) for tile in block] for block in blocks if block]
+
+
+class DDGrid:
+    """Defrag grid occupancy as a bitmask, tile (x, y) is bit y*width+x"""
+
+    def __init__(self, rect: pygame.Rect, width, height, cell_size):
+        self.rect = rect
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.full = (1 << width*height)-1
+        self.occupied = 0
+
+    def get_mask(self, coords):
+        """Returns mask of coords, or None if any are off the grid"""
+        mask = 0
+        for x, y in coords:
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                return None
+            mask |= 1 << (y*self.width+x)
+        return mask
+
+    def get_tile(self, pos):
+        """Returns coords of the tile whose top left is pos, or None if pos isn't on a tile corner"""
+        x, y = pos[0]-self.rect.left, pos[1]-self.rect.top
+        if x % self.cell_size or y % self.cell_size:
+            return None
+        return (x//self.cell_size, y//self.cell_size)
+
+    def get_nearest_tile(self, pos):
+        """Returns coords of the tile corner nearest pos, which may be off the grid. Halfway rounds towards the top left"""
+        return (ceil((pos[0]-self.rect.left)/self.cell_size-0.5), ceil((pos[1]-self.rect.top)/self.cell_size-0.5))
+
+    def get_tile_pos(self, coords):
+        return (self.rect.left+coords[0]*self.cell_size, self.rect.top+coords[1]*self.cell_size)
+
+    def is_full(self):
+        return self.occupied == self.full
+
+
+class DDPickIndex:
+    """Spatial hash of DDBlock tiles in cell_size squares, with a z value per block to find the one on top"""
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.buckets: dict[tuple[int, int], set[DDBlock]] = {}
+        self.block_buckets: dict[DDBlock, set[tuple[int, int]]] = {}
+        self.z: dict[DDBlock, int] = {}
+        self.top_z = 0
+
+    def get_buckets(self, block: 'DDBlock'):
+        buckets = set()
+        for rect in block.collision_rects:
+            for x in range(rect.left//self.cell_size, (rect.right-1)//self.cell_size+1):
+                for y in range(rect.top//self.cell_size, (rect.bottom-1)//self.cell_size+1):
+                    buckets.add((x, y))
+        return buckets
+
+    def add(self, block: 'DDBlock'):
+        self.block_buckets[block] = self.get_buckets(block)
+        for bucket in self.block_buckets[block]:
+            self.buckets.setdefault(bucket, set()).add(block)
+        self.raise_block(block)
+
+    def update(self, block: 'DDBlock'):
+        """Call after block has moved"""
+        new_buckets = self.get_buckets(block)
+        old_buckets = self.block_buckets[block]
+        for bucket in old_buckets-new_buckets:
+            self.buckets[bucket].discard(block)
+        for bucket in new_buckets-old_buckets:
+            self.buckets.setdefault(bucket, set()).add(block)
+        self.block_buckets[block] = new_buckets
+
+    def raise_block(self, block: 'DDBlock'):
+        self.top_z += 1
+        self.z[block] = self.top_z
+
+    def get_top(self, x, y):
+        """Returns the highest block covering (x, y), or None"""
+        candidates = self.buckets.get((x//self.cell_size, y//self.cell_size), ())
+        return max((block for block in candidates if block.collide(x, y)), key=self.z.get, default=None)
+
+
 class DDBlock:
-    def __init__(self, coordinates: list[tuple[int, int]], center_x, center_y, colour, grid_rect: pygame.Rect):
-        self.tile_size = 50
-        self.grid_rect = grid_rect
+    def __init__(self, coordinates: list[tuple[int, int]], center_x, center_y, colour, grid: DDGrid):
+        self.tile_size = grid.cell_size
+        self.grid = grid
+        self.grid_rect = grid.rect
         self.home_pos = (center_x, center_y)
-        self.tile_image = pygame.image.load(
-            f'images/DD/{colour}.png').convert_alpha()
+        self.tile_image = get_image(f'images/DD/{colour}.png')
+        if self.tile_image.get_width() != self.tile_size:
+            self.tile_image = pygame.transform.smoothscale(
+                self.tile_image, (self.tile_size, self.tile_size))
         self.normalise_coordinates(coordinates)
 
         no_tiles_wide = len(set(coord[0] for coord in self.coordinates))
@@ -469,48 +939,37 @@ class DDBlock:
             self.collision_rects.append(pygame.Rect(self.rect.left + self.tile_size *
                                                     tile[0], self.rect.top + self.tile_size*tile[1], self.tile_size, self.tile_size))
 
-    def occupied_tiles(self):
-        """Returns set of coords of occupied tiles"""
-        coords = set()
-        for tile in self.collision_rects:
-            try:
-                coords.add(DD_TILE_CENTERS_TO_COORDS[tile.center])
-            except KeyError:  # Tile is not snapped to grid
-                return set()
-        return coords
+    def occupied_mask(self):
+        """Returns grid mask of occupied tiles, 0 if not snapped to the grid"""
+        origin = self.grid.get_tile(self.rect.topleft)
+        if origin is None:
+            return 0
+        return self.grid.get_mask(tuple_addition(origin, tile) for tile in self.coordinates) or 0
 
-    def ungrab(self, occupied_tiles: set):
-        """Returns None if snap unsuccessful else returns newly occupied coords"""
+    def ungrab(self, occupied: int):
+        """Returns None if snap unsuccessful else returns mask of newly occupied tiles"""
         self.grabbed = False
-        snap_delta = None
 
         # Check grid alignment
-        if rect_full_collision(self.grid_rect.inflate(40, 40), self.rect):
-            tile = self.collision_rects[0]
-            deltas = [tuple_addition(
-                (-tile.centerx, -tile.centery), tile_center) for tile_center in DD_TILE_CENTERS]
-            snap_delta = min(deltas, key=tuple_pythag)
-        else:
+        if not rect_full_collision(self.grid_rect.inflate(40, 40), self.rect):
             if self.grid_rect.colliderect(self.rect):
                 return self.go_home()
             else:
                 return
+        origin = self.grid.get_nearest_tile(self.rect.topleft)
 
         # Check grid occupation
-        potential_occupations = set()
-        for tile in self.collision_rects:
-            moved_tile = tile.move(*snap_delta)
-            coords = DD_TILE_CENTERS_TO_COORDS[moved_tile.center]
-            if coords in occupied_tiles:
-                if self.grid_rect.colliderect(self.rect):
-                    return self.go_home()
-                else:
-                    return
+        mask = self.grid.get_mask(tuple_addition(origin, tile)
+                                  for tile in self.coordinates)
+        if mask is None or mask & occupied:
+            if self.grid_rect.colliderect(self.rect):
+                return self.go_home()
             else:
-                potential_occupations.add(coords)
+                return
         # Snap
-        self.drag(snap_delta)
-        return potential_occupations
+        self.drag(tuple_addition(self.grid.get_tile_pos(origin),
+                  (-self.rect.left, -self.rect.top)))
+        return mask
 
     def drag(self, delta):
         self.rect.move_ip(*delta)
@@ -555,10 +1014,6 @@ class ODNode:
     def drag(self, delta):
         self.pos = tuple_addition(self.pos, delta)
 
-    def randomise_position(self):
-        self.pos = (random.randint(round(0.2*MINIGAME_WIDTH), round(0.8*MINIGAME_WIDTH)),
-                    random.randint(round(0.2*MINIGAME_HEIGHT), round(0.8*MINIGAME_HEIGHT)))
-
     def get_pos(self):
         return self.pos
 
@@ -572,11 +1027,180 @@ class ODNode:
         self.grabbed = True
 
 
+class ODCrossingTable:
+    """Per connection pair table of crossings that is kept up to date as nodes move,
+    only the connections touching a moved node are retested"""
+
+    def __init__(self, positions, connections, intersect):
+        self.positions = list(positions)
+        self.connections = list(connections)
+        self.intersect = intersect
+        self.node_connections = {node: [] for node in range(len(self.positions))}
+        for index, connection in enumerate(self.connections):
+            for node in connection:
+                self.node_connections[node].append(index)
+
+        self.crossings = find_segment_crossings(
+            self.positions, self.connections, intersect)
+        self.connection_crossings = {index: set() for index in range(len(self.connections))}
+        for pair in self.crossings:
+            self.add_to_connections(pair)
+        self.changed = True
+
+    def __len__(self):
+        return len(self.crossings)
+
+    def add_to_connections(self, pair):
+        self.connection_crossings[pair[0]].add(pair)
+        self.connection_crossings[pair[1]].add(pair)
+
+    def remove_from_connections(self, pair):
+        self.connection_crossings[pair[0]].discard(pair)
+        self.connection_crossings[pair[1]].discard(pair)
+
+    def get_points(self):
+        return list(self.crossings.values())
+
+    def move_node(self, node, pos):
+        self.positions[node] = tuple(pos)
+        moved = self.node_connections[node]
+        for index in moved:
+            for pair in list(self.connection_crossings[index]):
+                self.crossings.pop(pair)
+                self.remove_from_connections(pair)
+                self.changed = True
+
+        pairs = []
+        for index in moved:
+            a, b = self.connections[index]
+            p1, p2 = self.positions[a], self.positions[b]
+            for other, (c, d) in enumerate(self.connections):
+                # Connections sharing a node can only meet at that node
+                if c in (a, b) or d in (a, b):
+                    continue
+                p3, p4 = self.positions[c], self.positions[d]
+                # Cheap bounding box rejection before the exact test
+                if max(p1[0], p2[0]) < min(p3[0], p4[0]) or max(p3[0], p4[0]) < min(p1[0], p2[0]) or \
+                        max(p1[1], p2[1]) < min(p3[1], p4[1]) or max(p3[1], p4[1]) < min(p1[1], p2[1]):
+                    continue
+                pairs.append((min(index, other), max(index, other)))
+
+        new_crossings = test_segment_pairs(
+            self.positions, self.connections, pairs, self.intersect)
+        for pair in new_crossings:
+            self.add_to_connections(pair)
+            self.changed = True
+        self.crossings.update(new_crossings)
+
+
+class ODGraphGenerator:
+    """Builds a planar driver graph then scrambles its nodes towards a number of line crossings.
+
+    Every stage runs a fixed number of steps, so unlike retrying random graphs it always finishes quickly"""
+    RADIUS = 340
+
+    def __init__(self, intersect, seed=None):
+        self.intersect = intersect
+        self.random = random.Random(seed)
+
+    def generate(self, outer_nodes, inner_nodes, target_crossings):
+        """Returns (node positions, connections)"""
+        positions, connections = self.build_planar(outer_nodes, inner_nodes)
+        return self.scramble(len(positions), connections, target_crossings), connections
+
+    def get_circle_positions(self, node_count, rotation=0):
+        center = (MINIGAME_WIDTH/2, MINIGAME_HEIGHT/2)
+        return [tuple_addition(center, (self.RADIUS*cos(rotation+(i*2*pi)/node_count),
+                                        self.RADIUS*sin(rotation+(i*2*pi)/node_count)))
+                for i in range(node_count)]
+
+    def get_random_position(self):
+        return (self.random.randint(round(0.2*MINIGAME_WIDTH), round(0.8*MINIGAME_WIDTH)),
+                self.random.randint(round(0.2*MINIGAME_HEIGHT), round(0.8*MINIGAME_HEIGHT)))
+
+    def triangulate(self, polygon):
+        """Random triangulation of a convex polygon by clipping ears, returns (triangles, chords)"""
+        polygon = list(polygon)
+        triangles = []
+        chords = []
+        while len(polygon) > 3:
+            # Every vertex of a convex polygon is an ear
+            i = self.random.randrange(len(polygon))
+            previous, next = polygon[i-1], polygon[(i+1) % len(polygon)]
+            triangles.append((previous, polygon[i], next))
+            chords.append((previous, next))
+            polygon.pop(i)
+        triangles.append(tuple(polygon))
+        return triangles, chords
+
+    def build_planar(self, outer_nodes, inner_nodes):
+        """Returns (node positions, connections) of a graph along with a layout that has no crossings"""
+        positions = self.get_circle_positions(outer_nodes)
+        connections = list(pairwise(range(outer_nodes)))
+        connections.append((0, outer_nodes-1))
+        triangles, chords = self.triangulate(range(outer_nodes))
+        connections.extend(chords)
+
+        # Inner nodes go inside a triangle and only connect to its corners, so can't cross anything
+        for _ in range(inner_nodes):
+            areas = [triangle_area(*(positions[corner] for corner in triangle))
+                     for triangle in triangles]
+            triangle = self.random.choices(triangles, weights=areas)[0]
+            weights = [self.random.uniform(0.2, 0.6) for _ in range(3)]
+            position = (0, 0)
+            for corner, weight in zip(triangle, weights):
+                position = tuple_addition(
+                    position, (positions[corner][0]*weight/sum(weights), positions[corner][1]*weight/sum(weights)))
+
+            node = len(positions)
+            positions.append(position)
+            for corner in self.random.sample(triangle, self.random.randint(2, 3)):
+                connections.append((node, corner))
+            triangles.remove(triangle)
+            a, b, c = triangle
+            triangles.extend([(node, a, b), (node, b, c), (node, c, a)])
+        return positions, connections
+
+    def scramble(self, node_count, connections, target_crossings):
+        """Random layout nudged one node at a time towards target_crossings, always has at least one crossing"""
+        layout = [self.get_random_position() for _ in range(node_count)]
+        table = ODCrossingTable(layout, connections, self.intersect)
+        for _ in range(OD_SCRAMBLE_STEPS):
+            error = abs(len(table)-target_crossings)
+            if error == 0:
+                break
+            node = self.random.randrange(node_count)
+            old_position = table.positions[node]
+            table.move_node(node, self.get_random_position())
+            if abs(len(table)-target_crossings) > error:
+                table.move_node(node, old_position)
+
+        if len(table) == 0:
+            return self.get_interleaved_layout(node_count, connections)
+        return table.positions
+
+    def get_interleaved_layout(self, node_count, connections):
+        """Circle layout where two connections that don't share a node have their ends alternate,
+        so they are guaranteed to cross"""
+        for (a, b), (c, d) in combinations(connections, 2):
+            if len({a, b, c, d}) == 4:
+                order = [a, c, b, d]
+                order.extend(
+                    node for node in range(node_count) if node not in order)
+                circle = self.get_circle_positions(
+                    node_count, self.random.uniform(0, 2*pi))
+                layout = [None]*node_count
+                for node, position in zip(order, circle):
+                    layout[node] = position
+                return layout
+        return self.get_circle_positions(node_count)
+
+
 class UAPassword:
     def __init__(self, text, start_pos):
         self.hashinator_input_location = (583, 314)
         self.snap_locations = [self.hashinator_input_location, start_pos]
-        self.font = pygame.font.SysFont('Arial', 24)
+        self.font = get_font('Arial', 24)
         self.text = text
         self.rendered_text = self.font.render(self.text, True, BLACK, GREY)
         self.rect = pygame.Rect(*start_pos, 170, 35)
@@ -610,8 +1234,8 @@ class UAPassword:
 class UARequest:
     def __init__(self, username, password, failed_attempts, correct_repsonse):
         self.correct_response = correct_repsonse
-        self.title_font = pygame.font.SysFont('Arial', 50)
-        self.body_font = pygame.font.SysFont('Arial', 30)
+        self.title_font = get_font('Arial', 50)
+        self.body_font = get_font('Arial', 30)
         self.username = username
         self.failed_attempts = failed_attempts
         self.rect = pygame.Rect(0, 0, 350, 200)
@@ -680,10 +1304,9 @@ class UAButton(Image):
 class BFArrow:
     def __init__(self, pos, direction, globabl_info_bar):
         self.global_info_bar = globabl_info_bar
-        self.image = pygame.image.load(
-            rf'images/BF/{direction}.png').convert_alpha()
-        self.highlighted_image = pygame.image.load(
-            rf'images/BF/highlighted/{direction}.png').convert_alpha()
+        self.image = get_image(f'images/BF/{direction}.png')
+        self.highlighted_image = get_image(
+            f'images/BF/highlighted/{direction}.png')
         self.rect = self.image.get_rect(center=pos)
         self.pressed = False
         self.highlighted = False
@@ -724,15 +1347,19 @@ class CSOuter:
     def __init__(self, center, image_name):
         self.center = center
         self.angle = 0
-        self.initial_image = pygame.image.load(image_name).convert_alpha()
-        self.image = pygame.image.load(image_name).convert_alpha()
+        self.initial_image = get_image(image_name)
+        self.image = self.initial_image
         self.rect = self.image.get_rect(center=self.center)
+        self.rotations = get_rotation_cache(image_name)
 
     def rotate_image_to(self, angle):
         self.angle = angle
-        self.image = pygame.transform.rotate(
-            self.initial_image, -degrees(self.get_angle()))
-        self.rect = self.image.get_rect(center=self.center)
+        self.image, rotated_size, crop_pos = self.rotations.get(
+            self.get_angle())
+        rotated_rect = pygame.Rect((0, 0), rotated_size)
+        rotated_rect.center = self.center
+        self.rect = self.image.get_rect(
+            topleft=tuple_addition(rotated_rect.topleft, crop_pos))
 
     def draw(self, screen: pygame.Surface):
         screen.blit(self.image, self.rect)
@@ -754,6 +1381,56 @@ class CSOuter:
         self.rotate_image_to(self.find_closest_angle())
 
 
+class DCBoard:
+    """Data compression grid, each row is a bitmask with bit x set if column x is taken,
+    alongside the colour of every slot"""
+
+    def __init__(self, width=DC_GRID_WIDTH, height=DC_GRID_HEIGHT):
+        self.width = width
+        self.height = height
+        self.full_row = (1 << width)-1
+        self.rows = [0]*height
+        self.colours = [[None]*width for _ in range(height)]
+
+    def piece_fits(self, piece, x, y):
+        """piece is an entry of DC_PIECE_MASKS with its tile coords offset by (x, y).
+        Walls and the floor block it, space above the grid doesn't"""
+        min_x, max_x, rows = piece
+        if x+min_x < 0 or x+max_x >= self.width:
+            return False
+        for row, mask in rows:
+            row += y
+            if row >= self.height:
+                return False
+            if row >= 0 and self.rows[row] & (mask << x if x >= 0 else mask >> -x):
+                return False
+        return True
+
+    def place(self, coords, colour):
+        for x, y in coords:
+            self.rows[y] |= 1 << x
+            self.colours[y][x] = colour
+
+    def clear_full_rows(self):
+        """Removes full rows, dropping everything above them, and returns how many were removed"""
+        kept = [y for y in range(self.height) if self.rows[y] != self.full_row]
+        cleared = self.height-len(kept)
+        if cleared:
+            self.rows[:] = [0]*cleared + [self.rows[y] for y in kept]
+            self.colours[:] = [[None]*self.width for _ in range(cleared)] + \
+                [self.colours[y] for y in kept]
+        return cleared
+
+    def get_filled_slots(self):
+        """Yields ((x, y), colour) of every taken slot"""
+        for y, row in enumerate(self.rows):
+            if not row:
+                continue
+            for x in range(self.width):
+                if row >> x & 1:
+                    yield (x, y), self.colours[y][x]
+
+
 class DCBlock:
     TYPES = ['straight',
              'square',
@@ -763,7 +1440,7 @@ class DCBlock:
              'Z',
              'reverseZ']
 
-    def __init__(self, image, colour, global_info_bar):
+    def __init__(self, image, colour, global_info_bar, grid_width=DC_GRID_WIDTH):
         self.global_info_bar = global_info_bar
         self.colour = colour
         self.last_fall_time = self.global_info_bar.get_time_elapsed()
@@ -771,7 +1448,7 @@ class DCBlock:
         self.tile_image = image
         self.type = random.choice(DCBlock.TYPES)
         self.rotation_state = 0
-        self.grid_offset = (4, -1)
+        self.grid_offset = (grid_width//2-1, -1)
         self.solid = False
         self.update_rect()
 
@@ -781,9 +1458,9 @@ class DCBlock:
             screen.blit(self.tile_image, (self.rect.left + self.tile_size *
                         tile[0], self.rect.top + self.tile_size*tile[1]))
 
-    def update(self, blocked_slots):
+    def update(self, board: DCBoard):
         if self.global_info_bar.get_time_elapsed()-self.last_fall_time >= 0.8:
-            self.attempt_fall(blocked_slots)
+            self.attempt_fall(board)
 
     def update_rect(self):
         if self.type in ['straight', 'square']:
@@ -798,67 +1475,38 @@ class DCBlock:
         else:
             return tuple_addition(DC_GRID_TOP_LEFT, (50*(1.5+self.grid_offset[0])+1, 50*(1.5+self.grid_offset[1])+1))
 
-    def rotate(self, direction, blocked_slots):
+    def rotate(self, direction, board: DCBoard):
         assert direction in ['clockwise', 'anticlockwise']
         if direction == 'clockwise':
-            self.change_rotation_state(1)
-            potential_coords = self.get_grid_coords()
-            self.change_rotation_state(-1)
-        if direction == 'anticlockwise':
-            self.change_rotation_state(-1)
-            potential_coords = self.get_grid_coords()
-            self.change_rotation_state(1)
-
-        for coord in potential_coords:
-            if coord in blocked_slots:
-                return
-            if coord[0] < 0 or coord[0] > 10:
-                return
-            if coord[1] < 0 or coord[1] > 12:
+            rotation_state = (self.rotation_state+1) % 4
+        else:
+            rotation_state = (self.rotation_state-1) % 4
+        piece = DC_PIECE_MASKS[self.type][rotation_state]
+        top_row = piece[2][0][0]
+
+        x, y = self.grid_offset
+        for dx, dy in DC_WALL_KICKS[self.type]:
+            # Pieces can't rotate up out of the top of the grid
+            if y+dy+top_row >= 0 and board.piece_fits(piece, x+dx, y+dy):
+                self.rotation_state = rotation_state
+                self.grid_offset = (x+dx, y+dy)
                 return
 
-        if direction == 'clockwise':
-            self.change_rotation_state(1)
-        elif direction == 'anticlockwise':
-            self.change_rotation_state(-1)
-
-    def change_rotation_state(self, delta):
-        self.rotation_state += delta
-        self.rotation_state %= 4
-
-    def move(self, direction, blocked_slots):
+    def move(self, direction, board: DCBoard):
+        x, y = self.grid_offset
         if direction == 'left':
-            potential_coords = [tuple_addition(
-                (-1, 0), coord) for coord in self.get_grid_coords()]
+            x -= 1
         elif direction == 'right':
-            potential_coords = [tuple_addition(
-                (1, 0), coord) for coord in self.get_grid_coords()]
-        success = True
-        for coord in potential_coords:
-            if coord in blocked_slots:
-                success = False
-                break
-            if coord[0] < 0 or coord[0] > 10:
-                success = False
-                break
-        if success:
-            if direction == 'left':
-                self.grid_offset = tuple_addition(self.grid_offset, (-1, 0))
-            if direction == 'right':
-                self.grid_offset = tuple_addition(self.grid_offset, (1, 0))
+            x += 1
+        if board.piece_fits(self.get_piece_mask(), x, y):
+            self.grid_offset = (x, y)
 
-    def attempt_fall(self, blocked_slots, forced=False):
+    def attempt_fall(self, board: DCBoard, forced=False):
         if not forced:
             self.last_fall_time = self.global_info_bar.get_time_elapsed()
-        potential_coords = [tuple_addition(
-            (0, 1), coord) for coord in self.get_grid_coords()]
-        success = True
-        for coord in potential_coords:
-            if coord in blocked_slots:
-                success = False
-                break
-        if success:
-            self.grid_offset = tuple_addition(self.grid_offset, (0, 1))
+        x, y = self.grid_offset
+        if board.piece_fits(self.get_piece_mask(), x, y+1):
+            self.grid_offset = (x, y+1)
         else:
             self.solid = True
 
@@ -871,25 +1519,197 @@ class DCBlock:
     def get_tile_coords(self):
         return DC_TILES[self.type][self.rotation_state]
 
-    def get_spawn_success(self, blocked_slots):
-        for coord in self.get_grid_coords():
-            if coord in blocked_slots:
-                return False
-        return True
+    def get_piece_mask(self):
+        return DC_PIECE_MASKS[self.type][self.rotation_state]
+
+    def get_spawn_success(self, board: DCBoard):
+        return board.piece_fits(self.get_piece_mask(), *self.grid_offset)
 
     def get_solid(self):
         return self.solid
 
 
+class DCAutoPlayer:
+    """Bot that plays DataCompression, used by headless.py for benchmarks and soak tests.
+
+    Every rotation and column the falling block can be dropped in is scored, then the block is steered
+    there through the same rotate, move and attempt_fall calls the keyboard uses"""
+    # (aggregate height, rows cleared, holes, bumpiness)
+    WEIGHTS = (-0.51, 0.76, -0.36, -0.18)
+
+    def __init__(self):
+        self.placements_evaluated = 0
+
+    def get_placements(self, board: DCBoard, block: DCBlock):
+        """Yields (rotation state, x, landing y) of every straight drop"""
+        seen_pieces = set()
+        for rotation_state in range(4):
+            piece = DC_PIECE_MASKS[block.type][rotation_state]
+            if piece in seen_pieces:  # Some pieces look the same in several rotation states
+                continue
+            seen_pieces.add(piece)
+            min_x, max_x, rows = piece
+            # Pieces can't rotate up out of the top of the grid
+            start_y = max(block.grid_offset[1], -rows[0][0])
+            for x in range(-min_x, board.width-max_x):
+                y = start_y
+                if not board.piece_fits(piece, x, y):
+                    continue
+                while board.piece_fits(piece, x, y+1):
+                    y += 1
+                yield rotation_state, x, y
+
+    def score_placement(self, board: DCBoard, piece_type, rotation_state, x, y):
+        self.placements_evaluated += 1
+        rows = list(board.rows)
+        for row, mask in DC_PIECE_MASKS[piece_type][rotation_state][2]:
+            rows[row+y] |= mask << x if x >= 0 else mask >> -x
+        kept_rows = [row for row in rows if row != board.full_row]
+        rows_cleared = len(rows)-len(kept_rows)
+
+        heights = [0]*board.width
+        covered = 0  # Columns with a tile somewhere above the current row
+        holes = 0
+        for y, row in enumerate(kept_rows, rows_cleared):
+            new_columns = row & ~covered
+            while new_columns:
+                column = new_columns & -new_columns
+                heights[column.bit_length()-1] = board.height-y
+                new_columns ^= column
+            covered |= row
+            holes += (covered & ~row).bit_count()
+        bumpiness = sum(abs(a-b) for a, b in pairwise(heights))
+
+        features = (sum(heights), rows_cleared, holes, bumpiness)
+        return sum(weight*feature for weight, feature in zip(DCAutoPlayer.WEIGHTS, features))
+
+    def play_block(self, minigame):
+        """Steers the falling block of a DataCompression minigame to the best placement and drops it"""
+        board: DCBoard = minigame.board
+        block: DCBlock = minigame.block
+        placements = list(self.get_placements(board, block))
+        if placements:
+            # Ties go to the deepest drop, otherwise wide boards fill up from the left
+            rotation_state, x, _ = max(placements, key=lambda placement: (self.score_placement(
+                board, block.type, *placement), placement[2]))
+
+            for _ in range(8):
+                if block.rotation_state == rotation_state or block.get_solid():
+                    break
+                previous_state = block.rotation_state
+                if (rotation_state-previous_state) % 4 <= 2:
+                    block.rotate('clockwise', board)
+                else:
+                    block.rotate('anticlockwise', board)
+                if block.rotation_state == previous_state:  # No room to turn yet
+                    block.attempt_fall(board, True)
+
+            while block.grid_offset[0] != x and not block.get_solid():
+                previous_offset = block.grid_offset
+                block.move('left' if x < block.grid_offset[0] else 'right', board)
+                if block.grid_offset == previous_offset:
+                    break
+
+        while not block.get_solid():
+            block.attempt_fall(board, True)
+
+
+class LeaderBoardStore:
+    """Last downloaded leaderboard data for each filter, saved to disk so it can be shown straight away.
+
+    refresh() asks the server for newer data on a background thread using conditional requests,
+    version goes up whenever new data arrives"""
+
+    def __init__(self, url=SERVER_URL+'read.php', cache_path=LEADERBOARD_CACHE_PATH):
+        self.url = url
+        self.cache_path = cache_path
+        self.lock = threading.Lock()  # Guards entries and refreshing
+        self.refreshing: set[str] = set()
+        self.version = 0
+        # Key -> {'data', 'etag', 'last_modified'}
+        self.entries: dict[str, dict] = {key: entry for key, entry in self.load_cache().items()
+                                         if isinstance(entry, dict)}
+
+    def get_data(self, key):
+        """Returns (data, version), data is empty if nothing has been downloaded for key yet"""
+        with self.lock:
+            entry = self.entries.get(key)
+            return ([] if entry is None else entry['data']), self.version
+
+    def load_cache(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f'Leaderboard cache could not be read, {e}')
+            return {}
+
+    def save_cache(self):
+        temporary_path = self.cache_path+'.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(temporary_path, self.cache_path)
+
+    def refresh(self, key, params):
+        """Starts checking the server for newer data for key, unless a check is already running.
+        params are the read.php query parameters for key"""
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+        threading.Thread(target=self.download, args=(
+            key, params), daemon=True).start()
+
+    def download(self, key, params):
+        try:
+            headers = {}
+            with self.lock:
+                entry = self.entries.get(key, {})
+                if entry.get('etag') is not None:
+                    headers['If-None-Match'] = entry['etag']
+                if entry.get('last_modified') is not None:
+                    headers['If-Modified-Since'] = entry['last_modified']
+            try:
+                r = requests.get(self.url, params=params, headers=headers,
+                                 timeout=UPLOAD_TIMEOUT)
+                if r.status_code == 304:  # Cached data is up to date
+                    return
+                if r.status_code != 200:
+                    print(
+                        f'Leaderboard download failed with code {r.status_code}, {SCHOOL_MODE=}')
+                    return
+                data = r.json()
+            except (requests.RequestException, ValueError) as e:
+                print(f'Leaderboard download failed, {e}, {SCHOOL_MODE=}')
+                return
+
+            with self.lock:
+                self.entries[key] = {'data': data, 'etag': r.headers.get('ETag'),
+                                     'last_modified': r.headers.get('Last-Modified')}
+                self.version += 1
+                self.save_cache()
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+
 class LeaderBoard:
     VERTICAL_LINES = [SCREEN_WIDTH *
                       (1/4), SCREEN_WIDTH*(1/2), SCREEN_WIDTH*(3/4)]
-
-    def __init__(self):
+    TIME_PERIOD_DAYS = {'Past day': 1,
+                        'Past week': 7,
+                        'Past month': 30,
+                        'Past year': 365,
+                        'All time': None}
+
+    def __init__(self, store: LeaderBoardStore):
+        self.store = store
         self.difficulty = 'All'
         self.time_period = 'All time'
         self.rect = pygame.Rect(14, 160, 1700, 800)
-        self.font = pygame.font.SysFont('Arial', 30)
+        self.font = get_font('Arial', 30)
 
         self.position_text = self.font.render('Position', True, BLACK, GREY)
         self.position_text_rect = self.position_text.get_rect(
@@ -907,22 +1727,31 @@ class LeaderBoard:
             'Difficulty', True, BLACK, GREY)
         self.difficulty_text_rect = self.difficulty_text.get_rect(
             centery=179, right=self.rect.right-10)
+        self.setup_background()
 
-        self.download_data()
         self.update_rows()
 
-    def draw(self, screen: pygame.Surface):
-        pygame.draw.rect(screen, GREY, self.rect)
-        pygame.draw.rect(screen, BLACK, self.rect, 1)
+    def setup_background(self):
+        """Column rules and header are drawn once onto a surface covering self.rect"""
+        self.background = pygame.Surface(self.rect.size)
+        offset = (-self.rect.left, -self.rect.top)
+        self.background.fill(GREY)
+        pygame.draw.rect(self.background, BLACK,
+                         self.background.get_rect(), 1)
         for line in LeaderBoard.VERTICAL_LINES:
-            pygame.draw.line(screen, BLACK, (line, self.rect.top),
-                             (line, self.rect.bottom))
+            pygame.draw.line(self.background, BLACK, (line+offset[0], 0),
+                             (line+offset[0], self.rect.height))
 
-        screen.blit(self.position_text, self.position_text_rect)
-        screen.blit(self.username_text, self.username_text_rect)
-        screen.blit(self.score_text, self.score_text_rect)
-        screen.blit(self.difficulty_text, self.difficulty_text_rect)
+        self.background.blit(self.position_text,
+                             self.position_text_rect.move(offset))
+        self.background.blit(self.username_text,
+                             self.username_text_rect.move(offset))
+        self.background.blit(self.score_text, self.score_text_rect.move(offset))
+        self.background.blit(self.difficulty_text,
+                             self.difficulty_text_rect.move(offset))
 
+    def draw(self, screen: pygame.Surface):
+        screen.blit(self.background, self.rect)
         for row in self.rows:
             row.draw(screen)
 
@@ -934,43 +1763,39 @@ class LeaderBoard:
         self.difficulty = difficulty
         self.update_rows()
 
-    def download_data(self):
-        r = requests.get('http://140.238.101.107/doorsos/read.php')
-        self.all_data = r.json()
+    def get_draw_state(self):
+        return self.rows
 
-    def matches_filters(self, data):
-        if data['difficulty'] != self.difficulty and self.difficulty != 'All':
-            return False
-        date_achieved = data['date'].split('-')
-        date_achieved = date(int(date_achieved[2]), int(
-            date_achieved[1]), int(date_achieved[0]))
-
-        if self.time_period == 'Past day':
-            delta = timedelta(days=1)
-        elif self.time_period == 'Past week':
-            delta = timedelta(days=7)
-        elif self.time_period == 'Past month':
-            delta = timedelta(days=30)
-        elif self.time_period == 'Past year':
-            delta = timedelta(days=365)
-        elif self.time_period == 'All time':
-            delta = 'ALL'
-        else:
+    def update(self):
+        """Swaps in new rows once the store has downloaded newer data"""
+        if self.store.version != self.data_version:
+            self.show_rows()
+
+    def get_query_params(self):
+        """read.php parameters for the current filters, the server does the filtering and sorting"""
+        if self.time_period not in LeaderBoard.TIME_PERIOD_DAYS:
             raise ValueError('Unknown date filter')
+        params = {'limit': LEADERBOARD_ROWS}
+        if self.difficulty != 'All':
+            params['difficulty'] = self.difficulty
+        days = LeaderBoard.TIME_PERIOD_DAYS[self.time_period]
+        if days is not None:
+            params['since'] = (date.today()-timedelta(days=days)
+                               ).strftime(r'%d-%m-%Y')
+        return params
 
-        if delta != 'ALL':
-            target_date = date.today()-delta
-            if date_achieved < target_date:
-                return False
+    def update_rows(self):
+        """Shows what was downloaded last time for the current filters while checking for anything newer"""
+        self.show_rows()
+        self.store.refresh(self.get_store_key(), self.get_query_params())
 
-        return True
+    def get_store_key(self):
+        return f'{self.difficulty}, {self.time_period}'
 
-    def update_rows(self):
-        filtered_data = [
-            data for data in self.all_data if self.matches_filters(data)]
-        filtered_data.sort(key=lambda x: x['score'], reverse=True)
-        self.rows = [LeaderBoardRow((self.rect.left, self.rect.top+((i+1)*38)), data, i+1)
-                     for i, data in enumerate(filtered_data[:20])]
+    def show_rows(self):
+        data, self.data_version = self.store.get_data(self.get_store_key())
+        self.rows = [LeaderBoardRow((self.rect.left, self.rect.top+((i+1)*38)), record, i+1)
+                     for i, record in enumerate(data[:LEADERBOARD_ROWS])]
 
     def click(self, x, y):
         pass
@@ -980,7 +1805,7 @@ class LeaderBoardRow:
     def __init__(self, topleft, data, position):
         self.rect = pygame.Rect(0, 0, 1700, 38)
         self.rect.topleft = topleft
-        self.font = pygame.font.SysFont('Arial', 30)
+        self.font = get_font('Arial', 30)
 
         self.position_text = self.font.render(str(position), True, BLACK, GREY)
         self.position_text_rect = self.position_text.get_rect(
@@ -1020,6 +1845,10 @@ def tuple_pythag(x):
     return sqrt(x[0]**2 + x[1]**2)
 
 
+def triangle_area(a, b, c):
+    return abs((b[0]-a[0])*(c[1]-a[1]) - (c[0]-a[0])*(b[1]-a[1]))/2
+
+
 def rect_full_collision(big: pygame.Rect, small: pygame.Rect):
     if not big.colliderect(small):
         return False
@@ -1034,9 +1863,93 @@ def rect_full_collision(big: pygame.Rect, small: pygame.Rect):
     return True
 
 
+def lerp(start, end, alpha):
+    return start + (end-start)*alpha
+
+
 def step_towards_number(value, step_size, target):
     return median([value-step_size, value+step_size, target])
 
 
 def add_noise(value, max_up, max_down):
     return value + random.randint(-max_down, max_up)
+
+
+def sweep_overlapping_pairs(positions, connections):
+    """Sweep-and-prune broad phase, yields index pairs of connections whose bounding boxes overlap.
+
+    Connections sharing a node are skipped, as they can only meet at that node"""
+    boxes = []
+    for index, (a, b) in enumerate(connections):
+        (x1, y1), (x2, y2) = positions[a], positions[b]
+        boxes.append((min(x1, x2), max(x1, x2),
+                     min(y1, y2), max(y1, y2), index))
+    boxes.sort()
+
+    active = []  # Boxes the sweep line is currently inside
+    for box in boxes:
+        left, right, bottom, top, index = box
+        active = [other for other in active if other[1] >= left]
+        for other in active:
+            if other[2] <= top and bottom <= other[3] and \
+                    not set(connections[index]).intersection(connections[other[4]]):
+                yield (min(index, other[4]), max(index, other[4]))
+        active.append(box)
+
+
+def batch_segment_crossings(positions, connections, pairs=None):
+    """NumPy version of OrganiseDrivers.check_line_intersection that tests many pairs in one go.
+
+    positions is (nodes, 2), connections is (connections, 2) node indices and pairs is (pairs, 2)
+    connection indices, defaulting to every pair. Returns (crossing mask, crossing points)"""
+    positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+    connections = np.asarray(connections, dtype=int).reshape(-1, 2)
+    if pairs is None:
+        pairs = np.column_stack(np.triu_indices(len(connections), 1))
+    pairs = np.asarray(pairs, dtype=int).reshape(-1, 2)
+
+    p1 = positions[connections[pairs[:, 0], 0]]
+    p2 = positions[connections[pairs[:, 0], 1]]
+    p3 = positions[connections[pairs[:, 1], 0]]
+    p4 = positions[connections[pairs[:, 1], 1]]
+    l1_delta = p2-p1
+    l2_delta = p4-p3
+    offset = p3-p1
+
+    denominator = l1_delta[:, 0]*l2_delta[:, 1] - l1_delta[:, 1]*l2_delta[:, 0]
+    # Collinear and parallel lines never count as crossing
+    not_parallel = denominator != 0
+    denominator = np.where(not_parallel, denominator, 1)
+    lamda = (offset[:, 0]*l2_delta[:, 1] - offset[:, 1]*l2_delta[:, 0])/denominator
+    mu = (offset[:, 0]*l1_delta[:, 1] - offset[:, 1]*l1_delta[:, 0])/denominator
+    mask = not_parallel & (0 <= lamda) & (lamda <= 1) & (0 <= mu) & (mu <= 1)
+
+    points = p1 + lamda[:, np.newaxis]*l1_delta
+    # Lines meeting at a node don't count, compared with the same tolerance as pygame's Vector2
+    for node in (p1, p2, p3, p4):
+        mask &= ~np.all(np.abs(points-node) < 1e-6, axis=1)
+    return mask, points
+
+
+def test_segment_pairs(positions, connections, pairs, intersect):
+    """Returns {(connection index, connection index): crossing point} for the given pairs,
+    intersect is the single pair test used when NumPy isn't installed"""
+    if not pairs:
+        return {}
+    if np is not None:
+        mask, points = batch_segment_crossings(positions, connections, pairs)
+        return {pairs[i]: tuple(points[i].tolist()) for i in np.flatnonzero(mask)}
+
+    crossings = {}
+    for i, j in pairs:
+        point = intersect(positions[connections[i][0]], positions[connections[i][1]],
+                          positions[connections[j][0]], positions[connections[j][1]])
+        if point:
+            crossings[(i, j)] = point
+    return crossings
+
+
+def find_segment_crossings(positions, connections, intersect):
+    """Returns {(connection index, connection index): crossing point} for every crossing"""
+    pairs = list(sweep_overlapping_pairs(positions, connections))
+    return test_segment_pairs(positions, connections, pairs, intersect)
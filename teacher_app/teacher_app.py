@@ -64,16 +64,15 @@ def delete_name(name):
 
 
 def download_data():
-    r = requests.get('http://140.238.101.107/doorsos/read.php')
+    r = requests.get('http://140.238.101.107/doorsos/read.php',
+                     params=get_query_params())
     return json.loads(r.text)
 
 
 def setup_rows(*args):
     for widget in inner_frame.winfo_children():
         widget.destroy()
-    all_data = download_data()
-    filtered_data = [data for data in all_data if matches_filters(data)]
-    filtered_data.sort(key=lambda x: x['score'], reverse=True)
+    filtered_data = download_data()
 
     rows = [Row(inner_frame, {'username': 'Submitted Username',
                               'actual_user': 'Actual User',
@@ -86,15 +85,13 @@ def setup_rows(*args):
         row.pack()
 
 
-def matches_filters(data):
+def get_query_params():
     difficulty = difficulty_strvar.get()
     time_period = time_strvar.get()
+    params = {}
 
-    if data['difficulty'] != difficulty and difficulty != 'All':
-        return False
-    date_achieved = data['date'].split('-')
-    date_achieved = date(int(date_achieved[2]), int(
-        date_achieved[1]), int(date_achieved[0]))
+    if difficulty != 'All':
+        params['difficulty'] = difficulty
 
     if time_period == 'Past day':
         delta = timedelta(days=1)
@@ -111,10 +108,9 @@ def matches_filters(data):
 
     if delta != 'ALL':
         target_date = date.today()-delta
-        if date_achieved < target_date:
-            return False
+        params['since'] = target_date.strftime(r'%d-%m-%Y')
 
-    return True
+    return params
 
 
 def check_auto_refresh():